@@ -11,6 +11,7 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
+import orjson
 import redis.asyncio as redis
 import websockets
 
@@ -78,7 +79,7 @@ async def oi_poller(redis_client: redis.Redis, symbol: str):
             if oi is not None:
                 ts = int(time.time() * 1000)
                 ev = open_interest_event(EXCHANGE, symbol, ts, oi, None)
-                await redis_client.xadd(STREAM_OPEN_INTEREST, {"payload": json.dumps(ev)}, maxlen=5000)
+                await redis_client.xadd(STREAM_OPEN_INTEREST, {"payload": orjson.dumps(ev)}, maxlen=5000)
         except Exception:
             pass
         await asyncio.sleep(1)
@@ -107,7 +108,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                     ts = int(payload.get("E", time.time() * 1000))
                     bids, asks = _parse_bids_asks(payload.get("b", []), payload.get("a", []))
                     ev = orderbook_event(EXCHANGE, symbol, "delta", ts, bids, asks, payload.get("u"))
-                    await r.xadd(STREAM_ORDERBOOK_UPDATES, {"payload": json.dumps(ev)}, maxlen=10000)
+                    await r.xadd(STREAM_ORDERBOOK_UPDATES, {"payload": orjson.dumps(ev)}, maxlen=10000)
                 elif f"{sym_lower}@aggTrade" in stream:
                     price = float(payload.get("p", 0))
                     size = float(payload.get("q", 0))
@@ -117,14 +118,14 @@ async def run_ingestor(redis_url: str, symbol: str):
                     if size <= 0:
                         continue
                     ev = trade_event(EXCHANGE, symbol, side, price, size, ts, trade_id)
-                    await r.xadd(STREAM_TRADES, {"payload": json.dumps(ev)}, maxlen=50000)
+                    await r.xadd(STREAM_TRADES, {"payload": orjson.dumps(ev)}, maxlen=50000)
                 elif f"{sym_lower}@forceOrder" in stream:
                     ts = int(payload.get("E", time.time() * 1000))
                     price = float(payload.get("p", 0))
                     qty = float(payload.get("q", 0))
                     side = "Sell" if payload.get("m") is True else "Buy"
                     ev = liquidation_event(EXCHANGE, symbol, ts, price, qty, side)
-                    await r.xadd(STREAM_LIQUIDATIONS, {"payload": json.dumps(ev)}, maxlen=10000)
+                    await r.xadd(STREAM_LIQUIDATIONS, {"payload": orjson.dumps(ev)}, maxlen=10000)
         except websockets.exceptions.ConnectionClosed as e:
             print(f"[binance] WS closed: {e}, reconnecting...")
         except Exception as e:
@@ -11,6 +11,7 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
+import orjson
 import redis.asyncio as redis
 import websockets
 
@@ -108,7 +109,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         if vol <= 0:
                             continue
                         ev = trade_event(EXCHANGE, symbol, side, price, vol, ts, trade_id)
-                        await r.xadd(STREAM_TRADES, {"payload": json.dumps(ev)}, maxlen=50000)
+                        await r.xadd(STREAM_TRADES, {"payload": orjson.dumps(ev)}, maxlen=50000)
 
                 elif topic == book_topic:
                     msg_type = data.get("type", "delta")
@@ -124,7 +125,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         asks,
                         d.get("u"),
                     )
-                    await r.xadd(STREAM_ORDERBOOK_UPDATES, {"payload": json.dumps(ev)}, maxlen=10000)
+                    await r.xadd(STREAM_ORDERBOOK_UPDATES, {"payload": orjson.dumps(ev)}, maxlen=10000)
 
                 elif topic == kline_topic:
                     for k in data.get("data", []):
@@ -136,7 +137,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         vol = float(k.get("volume", 0))
                         confirm = bool(k.get("confirm", False))
                         ev = candle_event(EXCHANGE, symbol, str(KLINE_INTERVAL), start_ts, o, h, lo, c, vol, confirm)
-                        await r.xadd(STREAM_KLINE, {"payload": json.dumps(ev)}, maxlen=5000)
+                        await r.xadd(STREAM_KLINE, {"payload": orjson.dumps(ev)}, maxlen=5000)
 
                 elif topic == tickers_topic:
                     for d in data.get("data", []):
@@ -145,7 +146,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         oi_value = d.get("openInterestValue")
                         oi_val = float(oi_value) if oi_value is not None else None
                         ev = open_interest_event(EXCHANGE, symbol, ts, oi, oi_val)
-                        await r.xadd(STREAM_OPEN_INTEREST, {"payload": json.dumps(ev)}, maxlen=5000)
+                        await r.xadd(STREAM_OPEN_INTEREST, {"payload": orjson.dumps(ev)}, maxlen=5000)
 
                 elif topic == liquidation_topic:
                     for liq in data.get("data", []):
@@ -158,7 +159,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         else:
                             side = "Sell"
                         ev = liquidation_event(EXCHANGE, symbol, ts, price, qty, side)
-                        await r.xadd(STREAM_LIQUIDATIONS, {"payload": json.dumps(ev)}, maxlen=10000)
+                        await r.xadd(STREAM_LIQUIDATIONS, {"payload": orjson.dumps(ev)}, maxlen=10000)
 
         except websockets.exceptions.ConnectionClosed as e:
             print(f"[bybit] WS closed: {e}, reconnecting...")
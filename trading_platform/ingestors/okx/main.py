@@ -12,6 +12,7 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
+import orjson
 import redis.asyncio as redis
 import websockets
 
@@ -111,7 +112,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                             asks,
                             d.get("ts"),
                         )
-                        await r.xadd(STREAM_ORDERBOOK_UPDATES, {"payload": json.dumps(ev)}, maxlen=10000)
+                        await r.xadd(STREAM_ORDERBOOK_UPDATES, {"payload": orjson.dumps(ev)}, maxlen=10000)
                 elif channel == "trades":
                     for t in data.get("data", []):
                         price = float(t.get("fillPx", t.get("px", 0)))
@@ -122,7 +123,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         if size <= 0:
                             continue
                         ev = trade_event(EXCHANGE, _inst_id_to_symbol(payload_inst), side, price, size, ts, trade_id)
-                        await r.xadd(STREAM_TRADES, {"payload": json.dumps(ev)}, maxlen=50000)
+                        await r.xadd(STREAM_TRADES, {"payload": orjson.dumps(ev)}, maxlen=50000)
                 elif channel == "open-interest":
                     for d in data.get("data", []):
                         ts = int(d.get("ts", time.time() * 1000))
@@ -130,7 +131,7 @@ async def run_ingestor(redis_url: str, symbol: str):
                         oi_val = d.get("openInterestValue")
                         oi_value = float(oi_val) if oi_val is not None else None
                         ev = open_interest_event(EXCHANGE, _inst_id_to_symbol(payload_inst), ts, oi, oi_value)
-                        await r.xadd(STREAM_OPEN_INTEREST, {"payload": json.dumps(ev)}, maxlen=5000)
+                        await r.xadd(STREAM_OPEN_INTEREST, {"payload": orjson.dumps(ev)}, maxlen=5000)
         except websockets.exceptions.ConnectionClosed as e:
             print(f"[okx] WS closed: {e}, reconnecting...")
         except Exception as e:
@@ -267,3 +267,92 @@ def write_rejected_at(event_id: str, exchange: str, symbol: str, price: float, t
         return False
     finally:
         d.close()
+
+
+# Batch variants for storage/graph_writer: N rows -> one UNWIND query (one Bolt round-trip)
+# and one driver per batch instead of a driver+session per record. Node ids match the single-row writers.
+
+def _run_batch(query: str, rows: list[dict[str, Any]]) -> bool:
+    """Run one UNWIND query. Returns False if Neo4j is not configured.
+
+    Unlike the single-row writers, driver/query errors are raised: graph_writer keeps
+    the rows and does not ack their stream entries until a write succeeds.
+    """
+    if not rows:
+        return True
+    d = _driver()
+    if not d:
+        return False
+    try:
+        with d.session() as session:
+            session.run(query, rows=rows).consume()
+        return True
+    finally:
+        d.close()
+
+
+def write_events_batch(rows: list[dict[str, Any]]) -> bool:
+    """Batch write_event. rows: dict(exchange, symbol, type, ts, payload[, hidden]).
+
+    hidden: MarketState ids not to link to (written in the same flush but after the event).
+    """
+    return _run_batch(
+        """
+        UNWIND $rows AS r
+        MERGE (e:Event {id: r.id})
+        SET e.exchange = r.exchange, e.symbol = r.symbol, e.type = r.type, e.ts = r.ts, e.payload = r.payload
+        WITH e, r
+        OPTIONAL MATCH (m:MarketState {exchange: r.exchange, symbol: r.symbol})
+        WHERE m.ts <= r.ts AND NOT m.id IN coalesce(r.hidden, [])
+        WITH e, m ORDER BY m.ts DESC
+        WITH e, collect(m)[0] AS m
+        WHERE m IS NOT NULL
+        MERGE (e)-[:PRECEDES]->(m)
+        """,
+        [
+            {
+                **row,
+                "id": f"{row['exchange']}:{row['symbol']}:{row['type']}:{row['ts']}",
+                "payload": str(row["payload"]),
+            }
+            for row in rows
+        ],
+    )
+
+
+def write_market_states_batch(rows: list[dict[str, Any]]) -> bool:
+    """Batch write_market_state. rows: dict(exchange, symbol, ts, price, oi)."""
+    return _run_batch(
+        """
+        UNWIND $rows AS r
+        MERGE (m:MarketState {id: r.id})
+        SET m.exchange = r.exchange, m.symbol = r.symbol, m.ts = r.ts, m.price = r.price, m.oi = r.oi
+        """,
+        [{**row, "id": f"{row['exchange']}:{row['symbol']}:{row['ts']}"} for row in rows],
+    )
+
+
+def write_price_levels_batch(rows: list[dict[str, Any]]) -> bool:
+    """Batch write_price_level. rows: dict(exchange, symbol, price, ts, vol_bid, vol_ask)."""
+    return _run_batch(
+        """
+        UNWIND $rows AS r
+        MERGE (pl:PriceLevel {id: r.id})
+        SET pl.exchange = r.exchange, pl.symbol = r.symbol, pl.price = r.price,
+            pl.ts = r.ts, pl.vol_bid = r.vol_bid, pl.vol_ask = r.vol_ask
+        """,
+        [{**row, "id": f"{row['exchange']}:{row['symbol']}:{row['price']}:{row['ts']}"} for row in rows],
+    )
+
+
+def write_trades_batch(rows: list[dict[str, Any]]) -> bool:
+    """Batch write_trade. rows: dict(id, exchange, symbol, ts, price, size, side)."""
+    return _run_batch(
+        """
+        UNWIND $rows AS r
+        MERGE (t:Trade {id: r.id})
+        SET t.exchange = r.exchange, t.symbol = r.symbol, t.ts = r.ts,
+            t.price = r.price, t.size = r.size, t.side = r.side
+        """,
+        rows,
+    )
@@ -6,11 +6,13 @@ import os
 # Sequence and model parameters
 SEQUENCE_LENGTH = 200  # Длина последовательности для Mamba
 TIMEFRAMES = ["1m", "5m", "15m"]  # Мульти-таймфрейм прогнозы
-INPUT_FEATURES = 25  # Общее количество признаков (trades + orderbook + kline + OI + liquidations)
+INPUT_FEATURES = 26  # Общее количество признаков (trades 7 + orderbook 5 + kline 8 + OI 3 + liquidations 3)
 HIDDEN_DIM = 256  # Размерность скрытого слоя Mamba
 D_STATE = 64  # Размерность состояния State Space Model
 D_CONV = 4  # Размерность конволюции
 EXPAND = 2  # Коэффициент расширения
+# RMSNorm (fused) вместо LayerNorm в backbone; должен совпадать при обучении и inference
+USE_RMS_NORM = os.environ.get("MAMBA_RMS_NORM", "false").lower() == "true"
 
 # Prediction settings
 PREDICTION_INTERVAL_SEC = 5  # Как часто делать предсказания (секунды)
@@ -25,6 +27,13 @@ MODEL_BASE_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "models")
 # Device
 DEVICE = "cuda" if os.environ.get("CUDA_AVAILABLE", "false").lower() == "true" else "cpu"
 
+# torch.compile(mode="reduce-overhead") для inference (CUDA Graphs); на CPU-only деплоях можно отключить
+USE_TORCH_COMPILE = os.environ.get("MAMBA_TORCH_COMPILE", "true" if DEVICE == "cuda" else "false").lower() == "true"
+
+# Ручной захват всего шага inference (H2D copy + forward + softmax) в один CUDA Graph;
+# заменяет torch.compile(mode="reduce-overhead"), т.к. форма входа статична
+USE_CUDA_GRAPH = os.environ.get("MAMBA_CUDA_GRAPH", "true" if DEVICE == "cuda" else "false").lower() == "true"
+
 # Feature extraction settings
 TRADES_WINDOW_SEC = 60  # Окно для агрегации trades (секунды)
 ORDERBOOK_DEPTH = 20  # Глубина стакана для анализа
@@ -36,7 +45,10 @@ LEARNING_RATE = 1e-4
 NUM_EPOCHS = 100
 VALIDATION_SPLIT = 0.2
 EARLY_STOPPING_PATIENCE = 10
+# Процессы DataLoader для сборки батчей параллельно с шагом на GPU; 0 — в основном потоке
+DATALOADER_WORKERS = int(os.environ.get("MAMBA_DATALOADER_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
 
 # Redis settings
 REDIS_STREAM_BLOCK_MS = 1000  # Блокировка при чтении из Redis Streams
+REDIS_STREAM_READ_COUNT = int(os.environ.get("MAMBA_STREAM_READ_COUNT", "20"))  # Сообщений за один XREADGROUP
 REDIS_BUFFER_SIZE = 1000  # Размер буфера для накопления данных
@@ -2,7 +2,6 @@
 Mamba Prediction Service: real-time price forecasting from Redis Streams.
 """
 import asyncio
-import json
 import argparse
 import sys
 import os
@@ -12,6 +11,7 @@ from typing import Dict, List, Optional, Tuple
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
+import orjson
 import redis.asyncio as redis
 import torch
 import numpy as np
@@ -37,12 +37,15 @@ from .config import (
     D_STATE,
     D_CONV,
     EXPAND,
+    USE_RMS_NORM,
     DEVICE,
+    USE_TORCH_COMPILE,
+    USE_CUDA_GRAPH,
     REDIS_STREAM_BLOCK_MS,
+    REDIS_STREAM_READ_COUNT,
 )
 from .models.multi_head import MultiHeadMambaPredictor
-from .preprocessing.feature_extractor import MarketFeatureExtractor
-from .preprocessing.normalizer import SimpleNormalizer
+from .preprocessing.feature_extractor import MarketFeatureExtractor, TradeColumns, is_buy_side
 
 
 class MambaPredictionService:
@@ -56,30 +59,95 @@ class MambaPredictionService:
         exchange: str = "bybit",
         symbol: str = "BTCUSDT",
         model_path: Optional[str] = None,
+        use_compile: Optional[bool] = None,
+        quantize: Optional[str] = None,
+        use_cuda_graph: Optional[bool] = None,
     ):
         self.redis_url = redis_url
         self.exchange = exchange
         self.symbol = symbol
         self.redis: Optional[redis.Redis] = None
         
-        # Буферы для накопления данных
-        self.trades_buffer: deque = deque(maxlen=SEQUENCE_LENGTH * 2)
+        # Ключи Redis постоянны для инстанса — форматируем один раз
+        self._dom_key = REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)
+        self._pred_key = REDIS_KEY_MAMBA_PREDICTIONS.format(exchange=exchange, symbol=symbol)
+        
+        # Consumer group на инстанс (exchange, symbol): каждому инстансу нужны все сообщения
+        # своего символа, Redis сам ведет offsets, NOACK — без роста pending list.
+        # Две реплики на один символ попадут в одну группу и поделят сообщения между собой —
+        # буферы каждой будут неполными; запускать по одному инстансу на (exchange, symbol)
+        self._group = f"mamba-pred:{exchange}:{symbol}"
+        self._consumer = f"{self._group}:{os.getpid()}"
+        self._streams = [
+            STREAM_TRADES,
+            STREAM_ORDERBOOK_UPDATES,
+            STREAM_KLINE,
+            STREAM_OPEN_INTEREST,
+            STREAM_LIQUIDATIONS,
+        ]
+        
+        # Буферы для накопления данных.
+        # Trades — SoA кольцевой буфер: непрерывные массивы полей, используемых в признаках,
+        # вместо deque из dict (нет per-object overhead, признаки считаются векторно).
+        # Каждая запись дублируется в слот idx + cap, поэтому любое окно последних n <= cap
+        # сделок — непрерывный срез (view) без копирования.
+        self._trade_cap = SEQUENCE_LENGTH * 2
+        self._trade_price = np.empty(2 * self._trade_cap, dtype=np.float64)
+        self._trade_size = np.empty(2 * self._trade_cap, dtype=np.float64)
+        self._trade_is_buy = np.empty(2 * self._trade_cap, dtype=bool)
+        self._trade_ts = np.empty(2 * self._trade_cap, dtype=np.int64)
+        self._trade_head = 0  # всего записано сделок (монотонно растет)
+        self._trade_fill = 0  # заполнено слотов, <= _trade_cap
         self.orderbook_buffer: deque = deque(maxlen=SEQUENCE_LENGTH)
         self.kline_buffer: deque = deque(maxlen=SEQUENCE_LENGTH)
         self.oi_buffer: deque = deque(maxlen=SEQUENCE_LENGTH)
         self.liquidations_buffer: deque = deque(maxlen=SEQUENCE_LENGTH)
         
-        # Feature extractor и normalizer
+        # Feature extractor (min-max нормализация окна выполняется внутри модели)
         self.feature_extractor = MarketFeatureExtractor()
-        self.normalizer = SimpleNormalizer()
         
         # Модель
         self.device = torch.device(DEVICE if torch.cuda.is_available() else "cpu")
+        self.use_cuda_graph = (USE_CUDA_GRAPH if use_cuda_graph is None else use_cuda_graph) and self.device.type == "cuda"
+        # Ручной CUDA Graph заменяет reduce-overhead (вложенный захват cudagraph trees не поддерживается)
+        self.use_compile = (
+            (USE_TORCH_COMPILE if use_compile is None else use_compile)
+            and hasattr(torch, "compile")
+            and not self.use_cuda_graph
+        )
+        self.quantize = quantize
         self.model = self._load_model(model_path)
         self.model.eval()
         
-        # Таймеры для предсказаний
+        # Постоянные буферы входа: pinned host -> device через non_blocking copy.
+        # Стабильные адреса обязательны для replay CUDA Graphs (mode="reduce-overhead").
+        self._host_buf = torch.empty(
+            (1, SEQUENCE_LENGTH, INPUT_FEATURES),
+            dtype=torch.float32,
+            pin_memory=(self.device.type == "cuda"),
+        )
+        self._host_view = self._host_buf.numpy()[0]  # (seq_len, n_features), общая память с _host_buf
+        if self.device.type == "cuda":
+            # Сырые признаки (цены) остаются в fp32 до нормализации внутри модели;
+            # в bf16 их приводит autocast на входе encoder
+            self._dev_buf = torch.empty_like(self._host_buf, device=self.device)
+        else:
+            self._dev_buf = self._host_buf
+        self._warmup()
+        
+        self._graph: Optional["torch.cuda.CUDAGraph"] = None
+        if self.use_cuda_graph:
+            self._capture_graph()
+        
+        # Таймеры для предсказаний; событие выставляет consume_streams при новых данных
         self.last_prediction_time = 0.0
+        self._data_event = asyncio.Event()
+        
+        # Ключ кэша признаков последовательности: (_trade_head, last_msg_id)
+        self._last_msg_id: Optional[bytes] = None
+        # Признаки окна (seq_len, n_features); пересчитываются только при новых сообщениях
+        self._feat_buf = np.zeros((SEQUENCE_LENGTH, INPUT_FEATURES), dtype=np.float32)
+        self._features_cache_key: Optional[Tuple[int, Optional[bytes]]] = None
         
         print(f"[mamba_predictor] Initialized for {exchange}/{symbol} on {self.device}")
     
@@ -91,6 +159,8 @@ class MambaPredictionService:
             d_state=D_STATE,
             d_conv=D_CONV,
             expand=EXPAND,
+            rms_norm=USE_RMS_NORM,
+            normalize_input=True,
         )
         
         if model_path and os.path.exists(model_path):
@@ -103,41 +173,214 @@ class MambaPredictionService:
         else:
             print("[mamba_predictor] Using untrained model (random weights)")
         
-        return model.to(self.device)
+        quantized = False
+        if self.quantize == "int8":
+            model, quantized = self._quantize_int8(model)
+        
+        model = model.to(self.device)
+        
+        # Reduced precision на GPU: bf16 веса (Ampere+), иначе fp16 autocast (Turing).
+        # int8 Linear слои (bitsandbytes) работают с fp16 активациями — только autocast.
+        # Только backbone и direction head: price_head выдает сырую цену и остается fp32
+        # (модель считает его вне autocast)
+        self._amp_dtype: Optional[torch.dtype] = None
+        if self.device.type == "cuda":
+            if torch.cuda.is_bf16_supported() and not quantized:
+                model = model.to(dtype=torch.bfloat16)
+                model.price_head.float()
+                self._amp_dtype = torch.bfloat16
+            else:
+                self._amp_dtype = torch.float16
+        model.eval()
+        
+        # Вход фиксированной формы (1, SEQUENCE_LENGTH, INPUT_FEATURES) — граф статичен,
+        # CUDA Graphs захватывают Mamba scan + heads один раз и дальше только replay
+        self._compiled_model = model
+        if self.use_compile:
+            try:
+                self._compiled_model = torch.compile(
+                    model,
+                    mode="reduce-overhead",
+                    fullgraph=True,
+                    dynamic=False,
+                )
+            except Exception as e:
+                print(f"[mamba_predictor] torch.compile failed: {e}, using eager model")
+        
+        return model
+    
+    def _quantize_int8(self, model: torch.nn.Module) -> Tuple[torch.nn.Module, bool]:
+        """
+        INT8 post-training квантизация Linear слоев (encoder/decoder и direction head).
+        
+        price_head не квантуется: его выход — сырая цена, int8 веса и fp16 активации
+        bitsandbytes ее не держат.
+        
+        CPU: dynamic quantization (scale активаций считается на лету, калибровка не нужна).
+        GPU: замена на bitsandbytes Linear8bitLt; веса квантуются при переносе на device.
+        
+        Returns:
+            (model, quantized)
+        """
+        if self.device.type == "cpu":
+            model.shared_mamba = torch.ao.quantization.quantize_dynamic(
+                model.shared_mamba, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            model.direction_head = torch.ao.quantization.quantize_dynamic(
+                model.direction_head, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            print("[mamba_predictor] Applied dynamic int8 quantization to Linear layers")
+            return model, True
+        
+        try:
+            import bitsandbytes as bnb
+        except ImportError:
+            print("[mamba_predictor] bitsandbytes not installed; int8 quantization on GPU disabled")
+            return model, False
+        
+        targets = [
+            (model.shared_mamba, "encoder"),
+            (model.shared_mamba, "decoder"),
+            (model.direction_head, "0"),
+            (model.direction_head, "3"),
+        ]
+        for parent, name in targets:
+            linear = getattr(parent, name)
+            q = bnb.nn.Linear8bitLt(
+                linear.in_features,
+                linear.out_features,
+                bias=linear.bias is not None,
+                has_fp16_weights=False,
+                threshold=6.0,
+            )
+            q.weight = bnb.nn.Int8Params(linear.weight.data, requires_grad=False, has_fp16_weights=False)
+            if linear.bias is not None:
+                q.bias = torch.nn.Parameter(linear.bias.data, requires_grad=False)
+            setattr(parent, name, q)
+        print("[mamba_predictor] Replaced Linear layers with bitsandbytes int8")
+        return model, True
+    
+    def _warmup(self) -> None:
+        """Прогрев модели, чтобы компиляция не попала на первый реальный запрос."""
+        self._dev_buf.zero_()
+        try:
+            self._forward(self._dev_buf)
+        except Exception as e:
+            print(f"[mamba_predictor] Warmup with compiled model failed: {e}, falling back to eager")
+            self._compiled_model = self.model
+    
+    def _push_trade(self, trade: Dict) -> None:
+        """Запись полей сделки в слот кольцевого буфера (и в его зеркало idx + cap)."""
+        idx = self._trade_head % self._trade_cap
+        slots = [idx, idx + self._trade_cap]
+        self._trade_price[slots] = float(trade.get("price", 0))
+        self._trade_size[slots] = float(trade.get("size", 0))
+        self._trade_is_buy[slots] = is_buy_side(trade.get("side", ""))
+        self._trade_ts[slots] = int(trade.get("ts") or 0)
+        self._trade_head += 1
+        self._trade_fill = min(self._trade_fill + 1, self._trade_cap)
+    
+    def _trade_window(self, n: int) -> TradeColumns:
+        """
+        Последние n сделок в хронологическом порядке — views на кольцевой буфер.
+        
+        Инвариант: consume_streams и predict работают в одном event loop, поэтому
+        чтение _trade_head и построение views не гонятся с _push_trade, пока между
+        получением окна и последним обращением к нему нет await. Если await нужен,
+        окно надо скопировать.
+        """
+        start = (self._trade_head - n) % self._trade_cap
+        window = slice(start, start + n)
+        return TradeColumns(
+            price=self._trade_price[window],
+            size=self._trade_size[window],
+            is_buy=self._trade_is_buy[window],
+            ts=self._trade_ts[window],
+        )
+    
+    def _capture_graph(self) -> None:
+        """
+        Захват полного шага inference в CUDA Graph: copy_ из pinned host буфера,
+        forward, softmax. predict() дальше только пишет в _host_buf и делает replay.
+        """
+        try:
+            # Прогрев на side stream перед захватом (ленивая инициализация cuBLAS/Triton)
+            side = torch.cuda.Stream()
+            side.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(side):
+                for _ in range(3):
+                    self._forward(self._dev_buf)
+            torch.cuda.current_stream().wait_stream(side)
+            
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                self._dev_buf.copy_(self._host_buf, non_blocking=True)
+                output = self._forward(self._dev_buf)
+                self._static_probs = torch.softmax(output["direction"], dim=1)
+                self._static_price = output["price"]
+            self._graph = graph
+            print("[mamba_predictor] Captured inference step into CUDA Graph")
+        except Exception as e:
+            print(f"[mamba_predictor] CUDA Graph capture failed: {e}, using stream inference")
+            self._graph = None
+    
+    def _forward(self, x: torch.Tensor) -> Dict[str, torch.Tensor]:
+        """Inference в reduced precision (кроме price_head); выходы приводятся к fp32."""
+        with torch.no_grad(), torch.autocast(
+            device_type=self.device.type,
+            dtype=self._amp_dtype or torch.bfloat16,
+            enabled=self._amp_dtype is not None,
+        ):
+            output = self._compiled_model(x)
+        return {name: t.float() for name, t in output.items()}
+    
+    async def _ensure_groups(self) -> None:
+        """Consumer group на каждом stream, позиционированная на конец (только живые данные).
+
+        Существующая группа (BUSYGROUP) сохраняет last-delivered id между рестартами — без
+        XGROUP SETID $ инстанс после простоя дочитывал бы старые сообщения и публиковал по ним
+        прогнозы как текущие. С NOACK pending list пуст, сдвиг ничего не теряет.
+        """
+        for stream in self._streams:
+            try:
+                await self.redis.xgroup_create(stream, self._group, id="$", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+                await self.redis.xgroup_setid(stream, self._group, id="$")
     
     async def consume_streams(self):
         """Чтение данных из Redis Streams и накопление в буферы."""
-        self.redis = redis.from_url(self.redis_url, decode_responses=True)
+        # Сырые bytes: orjson парсит их напрямую, без промежуточного UTF-8 decode
+        self.redis = redis.from_url(self.redis_url, decode_responses=False)
+        await self._ensure_groups()
         
-        last_ids = {
-            STREAM_TRADES: "$",
-            STREAM_ORDERBOOK_UPDATES: "$",
-            STREAM_KLINE: "$",
-            STREAM_OPEN_INTEREST: "$",
-            STREAM_LIQUIDATIONS: "$",
-        }
+        read_ids = {stream: ">" for stream in self._streams}
         
         while True:
             try:
-                result = await self.redis.xread(
-                    last_ids,
-                    count=50,
+                result = await self.redis.xreadgroup(
+                    self._group,
+                    self._consumer,
+                    read_ids,
+                    count=REDIS_STREAM_READ_COUNT,
                     block=REDIS_STREAM_BLOCK_MS,
+                    noack=True,
                 )
                 
                 if not result:
                     continue
                 
                 for stream_name, messages in result:
+                    stream_name = stream_name.decode()
                     for msg_id, fields in messages:
-                        last_ids[stream_name] = msg_id
-                        payload_str = (fields or {}).get("payload")
-                        if not payload_str:
+                        payload_raw = (fields or {}).get(b"payload")
+                        if not payload_raw:
                             continue
                         
                         try:
-                            payload = json.loads(payload_str)
-                        except json.JSONDecodeError:
+                            payload = orjson.loads(payload_raw)
+                        except orjson.JSONDecodeError:
                             continue
                         
                         # Фильтрация по exchange и symbol
@@ -148,7 +391,7 @@ class MambaPredictionService:
                         
                         # Добавление в соответствующий буфер
                         if stream_name == STREAM_TRADES:
-                            self.trades_buffer.append(payload)
+                            self._push_trade(payload)
                         elif stream_name == STREAM_ORDERBOOK_UPDATES:
                             self.orderbook_buffer.append(payload)
                         elif stream_name == STREAM_KLINE:
@@ -157,28 +400,51 @@ class MambaPredictionService:
                             self.oi_buffer.append(payload)
                         elif stream_name == STREAM_LIQUIDATIONS:
                             self.liquidations_buffer.append(payload)
+                        self._last_msg_id = msg_id
+                
+                # Будим prediction_loop: буферы пополнились
+                self._data_event.set()
                 
             except asyncio.CancelledError:
                 break
+            except redis.ResponseError as e:
+                # Stream удален/пересоздан — группы нужно создать заново
+                print(f"[mamba_predictor] Error in consume_streams: {e}")
+                if "NOGROUP" in str(e):
+                    await self._ensure_groups()
+                await asyncio.sleep(1)
             except Exception as e:
                 print(f"[mamba_predictor] Error in consume_streams: {e}")
                 await asyncio.sleep(1)
     
     async def prediction_loop(self):
-        """Основной цикл предсказаний."""
+        """
+        Основной цикл предсказаний.
+        
+        Спит ровно до следующего интервала, затем ждет сигнала от consume_streams о новых
+        данных. Без новых данных предсказание все равно обновляется раз в интервал, чтобы
+        ключ с последним прогнозом не протухал.
+        """
         while True:
             try:
-                current_time = time.time()
+                delay = self.last_prediction_time + PREDICTION_INTERVAL_SEC - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
                 
-                # Проверяем, нужно ли делать предсказание
-                if current_time - self.last_prediction_time >= PREDICTION_INTERVAL_SEC:
-                    if len(self.trades_buffer) >= MIN_SEQUENCE_LENGTH:
-                        prediction = await self.predict()
-                        if prediction:
-                            await self.publish_prediction(prediction)
-                            self.last_prediction_time = current_time
+                try:
+                    await asyncio.wait_for(self._data_event.wait(), timeout=PREDICTION_INTERVAL_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                self._data_event.clear()
                 
-                await asyncio.sleep(1)
+                if self._trade_fill < MIN_SEQUENCE_LENGTH:
+                    continue
+                
+                current_time = time.time()
+                prediction = await self.predict()
+                if prediction:
+                    await self.publish_prediction(prediction)
+                    self.last_prediction_time = current_time
                 
             except asyncio.CancelledError:
                 break
@@ -194,93 +460,77 @@ class MambaPredictionService:
             Словарь с предсказанием или None при ошибке
         """
         try:
-            # Получаем текущий DOM для orderbook
-            dom_key = REDIS_KEY_DOM.format(exchange=self.exchange, symbol=self.symbol)
-            dom_raw = await self.redis.get(dom_key)
-            current_orderbook = None
-            if dom_raw:
-                try:
-                    current_orderbook = json.loads(dom_raw)
-                except:
-                    pass
-            
-            # Если нет orderbook в буфере, используем текущий DOM
-            if not self.orderbook_buffer and current_orderbook:
-                orderbook_data = current_orderbook
-            elif self.orderbook_buffer:
-                orderbook_data = self.orderbook_buffer[-1]
-            else:
-                orderbook_data = None
-            
-            # Извлекаем признаки для последовательности
-            sequence_features = []
+            # Свежий orderbook из буфера не требует round-trip в Redis; текущий DOM
+            # запрашиваем, только если буфер пуст или отстал больше чем на интервал
+            orderbook_data = self.orderbook_buffer[-1] if self.orderbook_buffer else None
+            now_ms = time.time_ns() // 1_000_000
+            if orderbook_data is None or now_ms - (orderbook_data.get("ts") or 0) >= PREDICTION_INTERVAL_SEC * 1000:
+                dom_raw = await self.redis.get(self._dom_key)
+                if dom_raw:
+                    try:
+                        orderbook_data = orjson.loads(dom_raw)
+                    except orjson.JSONDecodeError:
+                        pass
             
-            # Берем последние SEQUENCE_LENGTH элементов из каждого буфера
-            trades_window = list(self.trades_buffer)[-SEQUENCE_LENGTH:] if len(self.trades_buffer) >= SEQUENCE_LENGTH else list(self.trades_buffer)
-            kline_window = list(self.kline_buffer)[-SEQUENCE_LENGTH:] if len(self.kline_buffer) >= SEQUENCE_LENGTH else list(self.kline_buffer)
-            oi_window = list(self.oi_buffer)[-SEQUENCE_LENGTH:] if len(self.oi_buffer) >= SEQUENCE_LENGTH else list(self.oi_buffer)
-            liq_window = list(self.liquidations_buffer)[-SEQUENCE_LENGTH:] if len(self.liquidations_buffer) >= SEQUENCE_LENGTH else list(self.liquidations_buffer)
+            # Берем последние SEQUENCE_LENGTH элементов из каждого буфера без копирования:
+            # trades — views на кольцевой буфер, остальные deque уже ограничены maxlen=SEQUENCE_LENGTH.
+            # Ниже до конца использования окон нет await (см. _trade_window).
+            trades_window = self._trade_window(min(self._trade_fill, SEQUENCE_LENGTH))
+            kline_window = self.kline_buffer
+            oi_window = self.oi_buffer
+            liq_window = self.liquidations_buffer
             
             # Если недостаточно данных, возвращаем None
             if len(trades_window) < MIN_SEQUENCE_LENGTH:
                 return None
             
-            # Извлекаем признаки для каждого временного шага
-            for i in range(len(trades_window)):
-                # Для каждого шага берем соответствующие данные
-                trades_slice = trades_window[:i+1] if i < len(trades_window) else trades_window
-                kline_slice = kline_window[:i+1] if i < len(kline_window) else kline_window
-                oi_slice = oi_window[:i+1] if i < len(oi_window) else oi_window
-                liq_slice = liq_window[:i+1] if i < len(liq_window) else liq_window
-                
-                # Извлекаем признаки
-                features = self.feature_extractor.combine_features(
-                    trades=trades_slice,
-                    orderbook=orderbook_data if i == len(trades_window) - 1 else None,
-                    klines=kline_slice,
-                    oi_list=oi_slice,
-                    liquidations=liq_slice,
+            # Признаки для всех временных шагов за один проход; повторный вызов без новых
+            # сообщений берет результат из кэша
+            cache_key = (self._trade_head, self._last_msg_id)
+            if self._features_cache_key != cache_key:
+                # Если недостаточно шагов, начало окна остается нулевым (padding);
+                # признаки пишутся прямо в хвост предвыделенного буфера
+                offset = SEQUENCE_LENGTH - len(trades_window)
+                self._feat_buf[:offset] = 0.0
+                self.feature_extractor.extract_sequence(
+                    trades=trades_window,
+                    orderbook=orderbook_data,
+                    klines=kline_window,
+                    oi_list=oi_window,
+                    liquidations=liq_window,
+                    out=self._feat_buf[offset:],
                 )
-                
-                sequence_features.append(features)
-            
-            # Если недостаточно признаков, дополняем нулями
-            while len(sequence_features) < SEQUENCE_LENGTH:
-                sequence_features.insert(0, np.zeros(INPUT_FEATURES))
+                self._features_cache_key = cache_key
             
-            # Берем последние SEQUENCE_LENGTH
-            sequence_features = sequence_features[-SEQUENCE_LENGTH:]
+            # Пишем сырые признаки в pinned host буфер и асинхронно копируем на device
+            # (без новых аллокаций); min-max нормализация — первый слой модели
+            np.copyto(self._host_view, self._feat_buf)
             
-            # Преобразуем в numpy массив
-            features_array = np.array(sequence_features)  # (seq_len, n_features)
-            
-            # Нормализация
-            features_normalized = self.normalizer.normalize_features(features_array, method="minmax")
-            
-            # Преобразуем в tensor
-            features_tensor = torch.tensor(
-                features_normalized,
-                dtype=torch.float32,
-            ).unsqueeze(0).to(self.device)  # (1, seq_len, n_features)
-            
-            # Inference
-            with torch.no_grad():
-                output = self.model(features_tensor)
+            # Inference: модель возвращает логиты, softmax считаем на device
+            if self._graph is not None:
+                # Replay захваченного шага (H2D copy + forward + softmax) без Python dispatch
+                self._graph.replay()
+                direction_probs = self._static_probs[0]
+                price = self._static_price[0]
+            else:
+                if self._dev_buf is not self._host_buf:
+                    self._dev_buf.copy_(self._host_buf, non_blocking=True)
+                output = self._forward(self._dev_buf)
+                direction_probs = torch.softmax(output["direction"], dim=1)[0]
+                price = output["price"][0]
             
-            # Извлекаем результаты
-            direction_probs = output["direction"].cpu().numpy()[0]  # [long_prob, short_prob]
-            predicted_price = float(output["price"].cpu().numpy()[0])
+            # Забираем результаты на host короткими копированиями (они же синхронизируют stream)
+            long_prob, short_prob = direction_probs.tolist()  # [long, short]
+            predicted_price = price.item()
             
             # Определяем направление
-            long_prob = float(direction_probs[0])
-            short_prob = float(direction_probs[1])
             direction = "long" if long_prob > short_prob else "short"
             confidence = max(long_prob, short_prob)
             
             # Получаем текущую цену для контекста
             current_price = None
-            if trades_window:
-                current_price = float(trades_window[-1].get("price", 0))
+            if len(trades_window):
+                current_price = float(trades_window.price[-1])
             elif orderbook_data and orderbook_data.get("bids") and orderbook_data.get("asks"):
                 best_bid = float(orderbook_data["bids"][0][0])
                 best_ask = float(orderbook_data["asks"][0][0])
@@ -289,7 +539,7 @@ class MambaPredictionService:
             prediction = {
                 "exchange": self.exchange,
                 "symbol": self.symbol,
-                "ts": int(time.time() * 1000),
+                "ts": time.time_ns() // 1_000_000,
                 "direction": direction,
                 "confidence": confidence,
                 "long_prob": long_prob,
@@ -310,19 +560,19 @@ class MambaPredictionService:
     async def publish_prediction(self, prediction: Dict):
         """Публикация предсказания в Redis Stream."""
         try:
-            payload = json.dumps(prediction)
-            await self.redis.xadd(
+            payload = orjson.dumps(prediction)
+            
+            # XADD + SET одним round-trip; maxlen ~ избегает точного O(N) trim на каждой записи
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.xadd(
                 STREAM_MAMBA_PREDICTIONS,
                 {"payload": payload},
                 maxlen=1000,
+                approximate=True,
             )
-            
             # Также сохраняем в Redis Key для быстрого доступа
-            key = REDIS_KEY_MAMBA_PREDICTIONS.format(
-                exchange=self.exchange,
-                symbol=self.symbol,
-            )
-            await self.redis.set(key, payload, ex=60)  # TTL 60 секунд
+            pipe.set(self._pred_key, payload, ex=60)  # TTL 60 секунд
+            await pipe.execute()
             
             print(f"[mamba_predictor] Published prediction: {prediction['direction']} ({prediction['confidence']:.2%})")
             
@@ -346,6 +596,19 @@ async def main():
     parser.add_argument("--exchange", default="bybit", help="Exchange name")
     parser.add_argument("--symbol", default="BTCUSDT", help="Symbol")
     parser.add_argument("--model", default=None, help="Path to model checkpoint")
+    parser.add_argument(
+        "--compile",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="torch.compile the model for inference (default: MAMBA_TORCH_COMPILE env)",
+    )
+    parser.add_argument("--quantize", choices=["int8"], default=None, help="Post-training quantization of Linear layers")
+    parser.add_argument(
+        "--cuda-graph",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Capture the inference step into a CUDA Graph (default: MAMBA_CUDA_GRAPH env)",
+    )
     args = parser.parse_args()
     
     service = MambaPredictionService(
@@ -353,6 +616,9 @@ async def main():
         exchange=args.exchange,
         symbol=args.symbol,
         model_path=args.model,
+        use_compile=args.compile,
+        quantize=args.quantize,
+        use_cuda_graph=args.cuda_graph,
     )
     
     try:
@@ -17,6 +17,34 @@ except ImportError:
         MAMBA_AVAILABLE = False
         Mamba2 = None
 
+try:
+    from mamba_ssm.ops.triton.layer_norm import RMSNorm
+except ImportError:
+    try:
+        from mamba_ssm.ops.triton.layernorm import RMSNorm  # mamba-ssm 1.x
+    except ImportError:
+        RMSNorm = None
+
+
+class _RMSNorm(nn.Module):
+    """
+    RMSNorm на чистом PyTorch: fallback без Triton ops mamba-ssm (nn.RMSNorm есть только с torch 2.4).
+    
+    Параметр weight и eps как у mamba-ssm RMSNorm — state_dict взаимозаменяем.
+    """
+    
+    def __init__(self, hidden_dim: int, eps: float = 1e-5):
+        super().__init__()
+        self.eps = eps
+        self.weight = nn.Parameter(torch.ones(hidden_dim))
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x * torch.rsqrt(x.pow(2).mean(-1, keepdim=True) + self.eps) * self.weight
+
+
+if RMSNorm is None:
+    RMSNorm = _RMSNorm
+
 
 class MambaForecaster(nn.Module):
     """
@@ -29,6 +57,8 @@ class MambaForecaster(nn.Module):
         d_conv: Размерность конволюции
         expand: Коэффициент расширения
         output_features: Количество выходных признаков
+        rms_norm: RMSNorm (fused Triton kernel из mamba-ssm) вместо LayerNorm перед Mamba блоком;
+            меняет state_dict (нет bias), чекпоинты с LayerNorm загружаются только с rms_norm=False
     """
     
     def __init__(
@@ -39,6 +69,7 @@ class MambaForecaster(nn.Module):
         d_conv: int = 4,
         expand: int = 2,
         output_features: int = 3,
+        rms_norm: bool = False,
     ):
         super().__init__()
         
@@ -54,26 +85,35 @@ class MambaForecaster(nn.Module):
         # Encoder: проекция входных признаков в скрытое пространство
         self.encoder = nn.Linear(input_features, hidden_dim)
         
-        # Mamba блок
+        # Mamba блок (layer_idx — ключ состояния в InferenceParams для потокового режима)
         self.mamba = Mamba2(
             d_model=hidden_dim,
             d_state=d_state,
             d_conv=d_conv,
             expand=expand,
+            layer_idx=0,
         )
         
         # Decoder: проекция из скрытого пространства в выход
         self.decoder = nn.Linear(hidden_dim, output_features)
         
-        # Layer normalization для стабильности
-        self.layer_norm = nn.LayerNorm(hidden_dim)
+        # Нормализация для стабильности: RMSNorm без центрирования — одна редукция вместо двух
+        # и один fused kernel; _RMSNorm как fallback для версий mamba-ssm без Triton ops
+        if rms_norm:
+            self.layer_norm = RMSNorm(hidden_dim)
+        else:
+            self.layer_norm = nn.LayerNorm(hidden_dim)
     
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor, inference_params=None) -> torch.Tensor:
         """
         Forward pass.
         
         Args:
             x: Input tensor of shape (batch, seq_len, input_features)
+            inference_params: mamba_ssm.utils.generation.InferenceParams для потокового
+                режима. Первый вызов (seqlen_offset=0) прогоняет полное окно и кэширует
+                состояние SSM; после увеличения seqlen_offset вызовы принимают только новый
+                шаг (seq_len=1) и обновляют состояние за O(1) вместо O(seq_len).
         
         Returns:
             Output tensor of shape (batch, output_features)
@@ -81,7 +121,7 @@ class MambaForecaster(nn.Module):
         # x: (batch, seq_len, input_features)
         x = self.encoder(x)  # (batch, seq_len, hidden_dim)
         x = self.layer_norm(x)
-        x = self.mamba(x)  # (batch, seq_len, hidden_dim)
+        x = self.mamba(x, inference_params=inference_params)  # (batch, seq_len, hidden_dim)
         x = x[:, -1, :]  # Берем последний таймстеп (batch, hidden_dim)
         x = self.decoder(x)  # (batch, output_features)
         return x
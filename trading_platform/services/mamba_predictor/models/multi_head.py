@@ -3,18 +3,37 @@ Multi-head Mamba model for direction classification and price regression.
 """
 import torch
 import torch.nn as nn
-from typing import Dict
+from typing import Dict, Optional, Tuple
 
 from .base import MambaForecaster
 
 
+class InputMinMaxNorm(nn.Module):
+    """
+    Min-max нормализация окна по оси времени внутри графа модели.
+    
+    Повторяет SimpleNormalizer.normalize_features(method="minmax"), но на device,
+    так что torch.compile может слить ее с первым Linear.
+    """
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        # x: (batch, seq_len, input_features)
+        min_vals, max_vals = torch.aminmax(x, dim=1, keepdim=True)
+        range_vals = max_vals - min_vals
+        range_vals = torch.where(range_vals == 0, torch.ones_like(range_vals), range_vals)
+        return (x - min_vals) / range_vals
+
+
 class MultiHeadMambaPredictor(nn.Module):
     """
     Multi-head модель для одновременного предсказания направления и цены.
     
     Использует общий Mamba backbone и два отдельных head:
     - Direction head: бинарная классификация (Long/Short)
-    - Price head: регрессия цены
+    - Price head: регрессия цены (всегда fp32, вне autocast)
+    
+    normalize_input=True добавляет InputMinMaxNorm перед backbone (real-time inference
+    на сырых признаках окна); rms_norm передается в MambaForecaster.
     """
     
     def __init__(
@@ -24,9 +43,13 @@ class MultiHeadMambaPredictor(nn.Module):
         d_state: int = 64,
         d_conv: int = 4,
         expand: int = 2,
+        normalize_input: bool = False,
+        rms_norm: bool = False,
     ):
         super().__init__()
         
+        self.norm = InputMinMaxNorm() if normalize_input else nn.Identity()
+        
         # Общий Mamba backbone (без decoder)
         self.shared_mamba = MambaForecaster(
             input_features=input_features,
@@ -35,15 +58,16 @@ class MultiHeadMambaPredictor(nn.Module):
             d_conv=d_conv,
             expand=expand,
             output_features=hidden_dim,  # Возвращаем features, а не финальный выход
+            rms_norm=rms_norm,
         )
         
-        # Direction head: бинарная классификация
+        # Direction head: бинарная классификация (логиты; softmax — на стороне потребителя,
+        # CrossEntropyLoss при обучении ожидает именно логиты)
         self.direction_head = nn.Sequential(
             nn.Linear(hidden_dim, 64),
             nn.ReLU(),
             nn.Dropout(0.1),
-            nn.Linear(64, 2),  # [long_prob, short_prob]
-            nn.Softmax(dim=1)
+            nn.Linear(64, 2),  # [long_logit, short_logit]
         )
         
         # Price head: регрессия
@@ -54,24 +78,29 @@ class MultiHeadMambaPredictor(nn.Module):
             nn.Linear(64, 1)  # Цена
         )
     
-    def forward(self, x: torch.Tensor) -> Dict[str, torch.Tensor]:
+    def forward(self, x: torch.Tensor, inference_params=None) -> Dict[str, torch.Tensor]:
         """
         Forward pass.
         
         Args:
             x: Input tensor of shape (batch, seq_len, input_features)
+            inference_params: кэш состояния SSM для потокового режима (см. MambaForecaster.forward).
+                Требует normalize_input=False: min-max по окну меняет все шаги при каждом сдвиге.
         
         Returns:
             Dictionary with:
-                - direction: (batch, 2) - probabilities [long, short]
+                - direction: (batch, 2) - logits [long, short]
                 - price: (batch, 1) - predicted price
         """
         # Получаем features из shared Mamba
-        features = self.shared_mamba(x)  # (batch, hidden_dim)
+        features = self.shared_mamba(self.norm(x), inference_params=inference_params)  # (batch, hidden_dim)
         
         # Применяем heads
         direction = self.direction_head(features)  # (batch, 2)
-        price = self.price_head(features)  # (batch, 1)
+        # Price head выдает сырую цену: вне autocast и в fp32 (в fp16 цена > 65504 — inf,
+        # в bf16 при ~67000 шаг 512); веса head держатся в fp32 (см. _load_model)
+        with torch.autocast(device_type=features.device.type, enabled=False):
+            price = self.price_head(features.float())  # (batch, 1)
         
         return {
             "direction": direction,
@@ -82,6 +111,9 @@ class MultiHeadMambaPredictor(nn.Module):
 class DirectionClassifier(nn.Module):
     """
     Отдельная модель только для классификации направления.
+    
+    backbone: готовый MambaForecaster (output_features=hidden_dim), общий с другими
+    головами (см. build_ensemble); если None — создается собственный.
     """
     
     def __init__(
@@ -91,9 +123,10 @@ class DirectionClassifier(nn.Module):
         d_state: int = 64,
         d_conv: int = 4,
         expand: int = 2,
+        backbone: Optional[MambaForecaster] = None,
     ):
         super().__init__()
-        self.mamba = MambaForecaster(
+        self.mamba = backbone if backbone is not None else MambaForecaster(
             input_features=input_features,
             hidden_dim=hidden_dim,
             d_state=d_state,
@@ -110,13 +143,18 @@ class DirectionClassifier(nn.Module):
         )
     
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        features = self.mamba(x)
+        return self.forward_features(self.mamba(x))
+    
+    def forward_features(self, features: torch.Tensor) -> torch.Tensor:
+        """Голова поверх уже посчитанных features backbone, shape (batch, hidden_dim)."""
         return self.classifier(features)
 
 
 class PriceRegressor(nn.Module):
     """
     Отдельная модель только для регрессии цены.
+    
+    backbone: готовый MambaForecaster, общий с другими головами (см. build_ensemble).
     """
     
     def __init__(
@@ -126,9 +164,10 @@ class PriceRegressor(nn.Module):
         d_state: int = 64,
         d_conv: int = 4,
         expand: int = 2,
+        backbone: Optional[MambaForecaster] = None,
     ):
         super().__init__()
-        self.mamba = MambaForecaster(
+        self.mamba = backbone if backbone is not None else MambaForecaster(
             input_features=input_features,
             hidden_dim=hidden_dim,
             d_state=d_state,
@@ -144,5 +183,39 @@ class PriceRegressor(nn.Module):
         )
     
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        features = self.mamba(x)
+        return self.forward_features(self.mamba(x))
+    
+    def forward_features(self, features: torch.Tensor) -> torch.Tensor:
+        """Голова поверх уже посчитанных features backbone, shape (batch, hidden_dim)."""
         return self.regressor(features).squeeze(-1)
+
+
+def build_ensemble(
+    input_features: int = 20,
+    hidden_dim: int = 256,
+    d_state: int = 64,
+    d_conv: int = 4,
+    expand: int = 2,
+) -> Tuple[MambaForecaster, DirectionClassifier, PriceRegressor]:
+    """
+    DirectionClassifier и PriceRegressor с одним общим Mamba backbone.
+    
+    При совместном использовании backbone считается один раз на шаг:
+        features = backbone(x)
+        probs = dir_head.forward_features(features)
+        price = price_head.forward_features(features)
+    
+    Returns:
+        (backbone, dir_head, price_head)
+    """
+    backbone = MambaForecaster(
+        input_features=input_features,
+        hidden_dim=hidden_dim,
+        d_state=d_state,
+        d_conv=d_conv,
+        expand=expand,
+        output_features=hidden_dim,
+    )
+    dir_head = DirectionClassifier(hidden_dim=hidden_dim, backbone=backbone)
+    price_head = PriceRegressor(hidden_dim=hidden_dim, backbone=backbone)
+    return backbone, dir_head, price_head
@@ -2,9 +2,264 @@
 Feature extraction from market data (trades, orderbook, kline, OI, liquidations).
 """
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 from collections import deque
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Строки для разбора list[dict] -> SoA; align=True выравнивает поля (нужно numba-ядрам)
+_TRADE_ROW = np.dtype([("price", "f8"), ("size", "f8"), ("is_buy", "?"), ("ts", "i8")], align=True)
+_KLINE_ROW = np.dtype(
+    [("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"), ("volume", "f8")],
+    align=True,
+)
+_LIQUIDATION_ROW = np.dtype([("quantity", "f8"), ("is_buy", "?"), ("ts", "i8")], align=True)
+
+
+def _readonly_zeros(n: int) -> np.ndarray:
+    z = np.zeros(n)
+    z.flags.writeable = False
+    return z
+
+
+# Общие нулевые векторы для веток без данных (прогрев, разрывы связи): без аллокации на
+# каждый вызов; read-only, чтобы случайная запись не испортила их для всех вызовов
+_ZEROS3 = _readonly_zeros(3)
+_ZEROS5 = _readonly_zeros(5)
+_ZEROS7 = _readonly_zeros(7)
+_ZEROS8 = _readonly_zeros(8)
+
+
+def is_buy_side(side) -> bool:
+    """
+    Сторона сделки/ликвидации — покупка ("Buy", "buy", "b", ...).
+    
+    Проверка первого символа: без временной строки от lower() (односимвольные строки
+    CPython кэширует), None/"" -> False.
+    """
+    return str(side)[:1] in ("b", "B")
+
+
+@dataclass
+class TradeColumns:
+    """
+    SoA-представление сделок: параллельные массивы полей вместо списка dict.
+    """
+    price: np.ndarray
+    size: np.ndarray
+    is_buy: np.ndarray
+    ts: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.price)
+    
+    @classmethod
+    def from_trades(cls, trades: Sequence[Dict]) -> "TradeColumns":
+        # Один проход по dict'ам прямо в предвыделенный structured массив (fromiter с count,
+        # без промежуточного списка); колонки — views на его поля
+        rows = np.fromiter(
+            (
+                (
+                    float(t.get("price", 0)),
+                    float(t.get("size", 0)),
+                    is_buy_side(t.get("side", "")),
+                    t.get("ts", 0),
+                )
+                for t in trades
+            ),
+            dtype=_TRADE_ROW,
+            count=len(trades),
+        )
+        return cls(price=rows["price"], size=rows["size"], is_buy=rows["is_buy"], ts=rows["ts"])
+
+
+@dataclass
+class KlineColumns:
+    """
+    SoA-представление свечей (OHLCV).
+    """
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.close)
+    
+    @classmethod
+    def from_klines(cls, klines: Sequence[Dict]) -> "KlineColumns":
+        rows = np.fromiter(
+            (
+                (
+                    float(k.get("open", 0)),
+                    float(k.get("high", 0)),
+                    float(k.get("low", 0)),
+                    float(k.get("close", 0)),
+                    float(k.get("volume", 0)),
+                )
+                for k in klines
+            ),
+            dtype=_KLINE_ROW,
+            count=len(klines),
+        )
+        return cls(
+            open=rows["open"],
+            high=rows["high"],
+            low=rows["low"],
+            close=rows["close"],
+            volume=rows["volume"],
+        )
+
+
+@dataclass
+class LiquidationColumns:
+    """
+    SoA-представление ликвидаций.
+    """
+    quantity: np.ndarray
+    is_buy: np.ndarray
+    ts: np.ndarray
+    
+    def __len__(self) -> int:
+        return len(self.quantity)
+    
+    @classmethod
+    def from_liquidations(cls, liquidations: Sequence[Dict]) -> "LiquidationColumns":
+        rows = np.fromiter(
+            (
+                (
+                    float(liq.get("quantity", 0)),
+                    is_buy_side(liq.get("side", "")),
+                    liq.get("ts", 0),
+                )
+                for liq in liquidations
+            ),
+            dtype=_LIQUIDATION_ROW,
+            count=len(liquidations),
+        )
+        return cls(quantity=rows["quantity"], is_buy=rows["is_buy"], ts=rows["ts"])
+
+
+def _rsi_core(closes: np.ndarray, period: int) -> float:
+    """RSI по последним period изменениям closes (длина period + 1), нормализованный к [0, 1]."""
+    gain = 0.0
+    loss = 0.0
+    for i in range(1, closes.shape[0]):
+        change = closes[i] - closes[i - 1]
+        if change > 0:
+            gain += change
+        else:
+            loss -= change
+    if loss > 0:
+        return (100.0 - 100.0 / (1.0 + gain / loss)) / 100.0
+    if gain > 0:
+        return 1.0
+    return np.nan
+
+
+def _macd_core(closes: np.ndarray, fast: int, slow: int) -> float:
+    """MACD как разница SMA(fast) и SMA по всему closes (длина slow), один проход."""
+    n = closes.shape[0]
+    fast_n = min(fast, n)
+    fast_sum = 0.0
+    slow_sum = 0.0
+    for i in range(n):
+        slow_sum += closes[i]
+        if i >= n - fast_n:
+            fast_sum += closes[i]
+    fast_ma = fast_sum / fast_n
+    slow_ma = slow_sum / n
+    return (fast_ma - slow_ma) / max(slow_ma, 1e-10)
+
+
+if NUMBA_AVAILABLE:
+    # Скомпилированные ядра кэшируются на диске (cache=True): JIT платится раз на деплой
+    _rsi_core = njit(cache=True, nogil=True, fastmath=True)(_rsi_core)
+    _macd_core = njit(cache=True, nogil=True, fastmath=True)(_macd_core)
+    
+    @njit(cache=True, nogil=True, fastmath=True, boundscheck=False)
+    def _trade_prefix_kernel(price, size, is_buy, ts, out):
+        """Признаки сделок для всех префиксов окна за один проход, запись в out (n, 7)."""
+        buy_volume = 0.0
+        sell_volume = 0.0
+        size_sum = 0.0
+        ts0 = ts[0]
+        for i in range(len(price)):
+            if is_buy[i]:
+                buy_volume += size[i]
+            else:
+                sell_volume += size[i]
+            size_sum += size[i]
+            count = i + 1.0
+            avg_size = size_sum / count
+            time_span = (ts[i] - ts0) / 1000.0
+            
+            out[i, 0] = price[i]
+            out[i, 1] = size[i]
+            out[i, 2] = buy_volume
+            out[i, 3] = sell_volume
+            out[i, 4] = (buy_volume - sell_volume) / max(buy_volume + sell_volume, 1e-10)
+            out[i, 5] = size[i] / max(avg_size, 1e-10)
+            out[i, 6] = count / max(time_span, 1.0) if i > 0 else 0.0
+    
+    @njit(cache=True, nogil=True, boundscheck=False)
+    def _kline_indicator_kernel(closes, period, fast, slow, out):
+        """RSI, MACD и изменение цены для всех префиксов klines, запись в out (n, 3)."""
+        for j in range(len(closes)):
+            length = j + 1
+            if length < period:
+                out[j, 0] = 0.0
+                out[j, 1] = 0.0
+                out[j, 2] = 0.0
+                continue
+            
+            rsi = 50.0
+            if length >= period + 1:
+                rsi = _rsi_core(closes[j - period:j + 1], period)
+            
+            macd = 0.0
+            if length >= slow:
+                macd = _macd_core(closes[length - slow:length], fast, slow)
+            
+            price_change = 0.0
+            if j > 0:
+                price_change = (closes[j] - closes[j - 1]) / max(closes[j - 1], 1e-10)
+            
+            out[j, 0] = rsi
+            out[j, 1] = macd
+            out[j, 2] = price_change
+    
+    @njit(cache=True, parallel=True, fastmath=True, boundscheck=False)
+    def _trade_window_kernel(price, size, is_buy, ts, window, out):
+        """extract_from_trades для всех окон длины window, окна параллельно по ядрам."""
+        for s in prange(out.shape[0]):
+            last = s + window - 1
+            buy_volume = 0.0
+            total_volume = 0.0
+            for k in range(s, s + window):
+                total_volume += size[k]
+                if is_buy[k]:
+                    buy_volume += size[k]
+            sell_volume = total_volume - buy_volume
+            
+            out[s, 0] = price[last]
+            out[s, 1] = size[last]
+            out[s, 2] = buy_volume
+            out[s, 3] = sell_volume
+            out[s, 4] = (buy_volume - sell_volume) / max(total_volume, 1e-10)
+            out[s, 5] = size[last] / max(total_volume / window, 1e-10)
+            if window >= 2:
+                out[s, 6] = window / max((ts[last] - ts[s]) / 1000.0, 1.0)
+            else:
+                out[s, 6] = 0.0
+
 
 class MarketFeatureExtractor:
     """
@@ -12,13 +267,17 @@ class MarketFeatureExtractor:
     Объединяет все источники в единый вектор признаков для Mamba модели.
     """
     
+    # trades (7) + orderbook (5) + klines (8) + OI (3) + liquidations (3)
+    NUM_FEATURES = 26
+    
     def __init__(self, orderbook_depth: int = 20):
         self.orderbook_depth = orderbook_depth
     
     def extract_from_trades(
         self,
-        trades: List[Dict],
-        window_sec: int = 60
+        trades: Union[List[Dict], TradeColumns],
+        window_sec: int = 60,
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Извлечение признаков из сделок.
@@ -26,47 +285,42 @@ class MarketFeatureExtractor:
         Returns:
             Массив признаков: [price, size, buy_volume, sell_volume, delta, aggression, trade_rate]
         """
-        if not trades:
-            return np.zeros(7)
+        if not isinstance(trades, TradeColumns):
+            trades = TradeColumns.from_trades(trades)
+        n = len(trades)
+        if n == 0:
+            return self._emit(out, _ZEROS7)
         
         # Последняя сделка
-        last_trade = trades[-1]
-        price = float(last_trade.get("price", 0))
-        size = float(last_trade.get("size", 0))
-        side = str(last_trade.get("side", "")).lower()
-        
-        # Агрегация за окно
-        buy_volume = sum(
-            float(t.get("size", 0))
-            for t in trades
-            if str(t.get("side", "")).lower().startswith("b")
-        )
-        sell_volume = sum(
-            float(t.get("size", 0))
-            for t in trades
-            if not str(t.get("side", "")).lower().startswith("b")
-        )
-        total_volume = buy_volume + sell_volume
+        sizes = trades.size
+        price = float(trades.price[-1])
+        size = float(sizes[-1])
+        
+        # Агрегация за окно — редукции в NumPy вместо генераторов по dict'ам
+        total_volume = float(sizes.sum())
+        buy_volume = float(sizes[trades.is_buy].sum())
+        sell_volume = total_volume - buy_volume
         
         # Delta (разница между buy и sell объемом)
         delta = (buy_volume - sell_volume) / max(total_volume, 1e-10)
         
         # Aggression (отношение размера к среднему)
-        avg_size = np.mean([float(t.get("size", 0)) for t in trades]) if trades else size
+        avg_size = total_volume / n
         aggression = size / max(avg_size, 1e-10)
         
         # Trade rate (количество сделок в секунду)
-        if len(trades) >= 2:
-            time_span = (trades[-1].get("ts", 0) - trades[0].get("ts", 0)) / 1000.0
-            trade_rate = len(trades) / max(time_span, 1.0)
+        if n >= 2:
+            time_span = (trades.ts[-1] - trades.ts[0]) / 1000.0
+            trade_rate = n / max(time_span, 1.0)
         else:
             trade_rate = 0.0
         
-        return np.array([price, size, buy_volume, sell_volume, delta, aggression, trade_rate])
+        return self._emit(out, [price, size, buy_volume, sell_volume, delta, aggression, trade_rate])
     
     def extract_from_orderbook(
         self,
-        orderbook: Dict
+        orderbook: Dict,
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Извлечение признаков из стакана заявок.
@@ -75,24 +329,29 @@ class MarketFeatureExtractor:
             Массив признаков: [spread, volume_imbalance, bid_depth, ask_depth, weighted_mid]
         """
         if not orderbook or "bids" not in orderbook or "asks" not in orderbook:
-            return np.zeros(5)
+            return self._emit(out, _ZEROS5)
         
         bids = orderbook.get("bids", [])
         asks = orderbook.get("asks", [])
         
-        if not bids or not asks:
-            return np.zeros(5)
+        if len(bids) == 0 or len(asks) == 0:
+            return self._emit(out, _ZEROS5)
         
-        best_bid = float(bids[0][0])
-        best_ask = float(asks[0][0])
+        # Уровни [price, size, ...] -> (depth, k) float64 одной конверсией (строки тоже парсятся);
+        # уже готовые ndarray-снапшоты проходят без копии
+        bid_arr = np.asarray(bids[:self.orderbook_depth], dtype=np.float64)
+        ask_arr = np.asarray(asks[:self.orderbook_depth], dtype=np.float64)
+        
+        best_bid = float(bid_arr[0, 0])
+        best_ask = float(ask_arr[0, 0])
         
         # Spread
         spread = best_ask - best_bid
         spread_pct = spread / max(best_bid, 1e-10)
         
         # Volume imbalance
-        bid_volume = sum(float(b[1]) for b in bids[:self.orderbook_depth])
-        ask_volume = sum(float(a[1]) for a in asks[:self.orderbook_depth])
+        bid_volume = float(bid_arr[:, 1].sum())
+        ask_volume = float(ask_arr[:, 1].sum())
         total_depth = bid_volume + ask_volume
         volume_imbalance = (bid_volume - ask_volume) / max(total_depth, 1e-10)
         
@@ -106,12 +365,13 @@ class MarketFeatureExtractor:
         else:
             weighted_mid = (best_bid + best_ask) / 2
         
-        return np.array([spread_pct, volume_imbalance, bid_depth, ask_depth, weighted_mid])
+        return self._emit(out, [spread_pct, volume_imbalance, bid_depth, ask_depth, weighted_mid])
     
     def extract_from_kline(
         self,
-        klines: List[Dict],
-        use_indicators: bool = True
+        klines: Union[List[Dict], KlineColumns],
+        use_indicators: bool = True,
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Извлечение признаков из свечей (OHLCV).
@@ -119,17 +379,19 @@ class MarketFeatureExtractor:
         Returns:
             Массив признаков: [open, high, low, close, volume, rsi, macd, ...]
         """
-        if not klines:
-            return np.zeros(8 if use_indicators else 5)
-        
-        last_candle = klines[-1]
-        open_price = float(last_candle.get("open", 0))
-        high = float(last_candle.get("high", 0))
-        low = float(last_candle.get("low", 0))
-        close = float(last_candle.get("close", 0))
-        volume = float(last_candle.get("volume", 0))
-        
-        features = [open_price, high, low, close, volume]
+        if not isinstance(klines, KlineColumns):
+            klines = KlineColumns.from_klines(klines)
+        if len(klines) == 0:
+            return self._emit(out, _ZEROS8 if use_indicators else _ZEROS5)
+        
+        close = float(klines.close[-1])
+        features = [
+            float(klines.open[-1]),
+            float(klines.high[-1]),
+            float(klines.low[-1]),
+            close,
+            float(klines.volume[-1]),
+        ]
         
         if use_indicators and len(klines) >= 14:
             # RSI (упрощенный)
@@ -142,7 +404,7 @@ class MarketFeatureExtractor:
             
             # Price change
             if len(klines) >= 2:
-                prev_close = float(klines[-2].get("close", close))
+                prev_close = float(klines.close[-2])
                 price_change = (close - prev_close) / max(prev_close, 1e-10)
                 features.append(price_change)
             else:
@@ -151,11 +413,12 @@ class MarketFeatureExtractor:
             if use_indicators:
                 features.extend([0.0, 0.0, 0.0])
         
-        return np.array(features)
+        return self._emit(out, features)
     
     def extract_from_open_interest(
         self,
-        oi_list: List[Dict]
+        oi_list: List[Dict],
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Извлечение признаков из открытого интереса.
@@ -164,7 +427,7 @@ class MarketFeatureExtractor:
             Массив признаков: [oi, oi_change, oi_value]
         """
         if not oi_list:
-            return np.zeros(3)
+            return self._emit(out, _ZEROS3)
         
         last_oi = oi_list[-1]
         oi = float(last_oi.get("open_interest", 0))
@@ -177,12 +440,13 @@ class MarketFeatureExtractor:
         else:
             oi_change = 0.0
         
-        return np.array([oi, oi_change, oi_value])
+        return self._emit(out, [oi, oi_change, oi_value])
     
     def extract_from_liquidations(
         self,
-        liquidations: List[Dict],
-        window_sec: int = 60
+        liquidations: Union[List[Dict], LiquidationColumns],
+        window_sec: int = 60,
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Извлечение признаков из ликвидаций.
@@ -190,95 +454,368 @@ class MarketFeatureExtractor:
         Returns:
             Массив признаков: [liq_volume, liq_rate, buy_liq_ratio]
         """
-        if not liquidations:
-            return np.zeros(3)
+        if not isinstance(liquidations, LiquidationColumns):
+            liquidations = LiquidationColumns.from_liquidations(liquidations)
+        n = len(liquidations)
+        if n == 0:
+            return self._emit(out, _ZEROS3)
+        
+        quantity = liquidations.quantity
         
         # Объем ликвидаций
-        liq_volume = sum(float(liq.get("quantity", 0)) for liq in liquidations)
+        liq_volume = float(quantity.sum())
         
         # Rate (ликвидаций в секунду)
-        if len(liquidations) >= 2:
-            time_span = (liquidations[-1].get("ts", 0) - liquidations[0].get("ts", 0)) / 1000.0
-            liq_rate = len(liquidations) / max(time_span, 1.0)
+        if n >= 2:
+            time_span = (liquidations.ts[-1] - liquidations.ts[0]) / 1000.0
+            liq_rate = n / max(time_span, 1.0)
         else:
             liq_rate = 0.0
         
         # Buy/Sell ratio
-        buy_liq = sum(
-            float(liq.get("quantity", 0))
-            for liq in liquidations
-            if str(liq.get("side", "")).lower().startswith("b")
-        )
+        buy_liq = float(quantity[liquidations.is_buy].sum())
         buy_liq_ratio = buy_liq / max(liq_volume, 1e-10)
         
-        return np.array([liq_volume, liq_rate, buy_liq_ratio])
+        return self._emit(out, [liq_volume, liq_rate, buy_liq_ratio])
     
     def combine_features(
         self,
-        trades: List[Dict],
+        trades: Union[List[Dict], TradeColumns],
         orderbook: Optional[Dict],
-        klines: List[Dict],
+        klines: Union[List[Dict], KlineColumns],
         oi_list: List[Dict],
-        liquidations: List[Dict],
+        liquidations: Union[List[Dict], LiquidationColumns],
+        out: Optional[np.ndarray] = None,
     ) -> np.ndarray:
         """
         Объединение всех признаков в единый вектор.
         
+        trades/klines/liquidations принимаются и как list[dict], и как SoA-колонки
+        (TradeColumns/KlineColumns/LiquidationColumns). Вызывающий код, который строит
+        много окон по одним данным, конвертирует их в колонки один раз и передает срезы.
+        
+        Args:
+            out: Буфер shape (NUM_FEATURES,) для переиспользования между тиками; каждый
+                extract_from_* пишет в свой срез, без промежуточных массивов и concatenate
+        
         Returns:
-            Массив shape (num_features,) - объединенные признаки
+            Массив shape (num_features,) - объединенные признаки (out, если передан)
         """
-        trade_features = self.extract_from_trades(trades)
-        orderbook_features = self.extract_from_orderbook(orderbook) if orderbook else np.zeros(5)
-        kline_features = self.extract_from_kline(klines)
-        oi_features = self.extract_from_open_interest(oi_list)
-        liq_features = self.extract_from_liquidations(liquidations)
-        
-        # Объединяем все признаки
-        combined = np.concatenate([
-            trade_features,      # 7 features
-            orderbook_features,   # 5 features
-            kline_features,      # 5-8 features
-            oi_features,         # 3 features
-            liq_features,        # 3 features
-        ])
-        
-        return combined
+        if out is None:
+            out = np.empty(self.NUM_FEATURES)
+        
+        self.extract_from_trades(trades, out=out[0:7])
+        if orderbook:
+            self.extract_from_orderbook(orderbook, out=out[7:12])
+        else:
+            out[7:12] = 0.0
+        self.extract_from_kline(klines, out=out[12:20])
+        self.extract_from_open_interest(oi_list, out=out[20:23])
+        self.extract_from_liquidations(liquidations, out=out[23:26])
+        
+        return out
     
-    def _calculate_rsi(self, klines: List[Dict], period: int = 14) -> float:
-        """Упрощенный расчет RSI."""
-        if len(klines) < period + 1:
-            return 50.0
+    @staticmethod
+    def _emit(out: Optional[np.ndarray], values) -> np.ndarray:
+        """
+        Запись признаков в out (срез общего буфера) или в новый массив, если out не задан.
+        
+        Нулевые константы _ZEROS* без out возвращаются как есть (read-only, без копии).
+        """
+        if out is None:
+            if isinstance(values, np.ndarray) and not values.flags.writeable:
+                return values
+            return np.array(values, dtype=np.float64)
+        out[:] = values
+        return out
+    
+    def extract_sequence(
+        self,
+        trades: Union[List[Dict], TradeColumns],
+        orderbook: Optional[Dict],
+        klines: Sequence[Dict],
+        oi_list: Sequence[Dict],
+        liquidations: Sequence[Dict],
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Признаки для каждого шага окна trades за один векторизованный проход.
         
-        closes = [float(k.get("close", 0)) for k in klines[-period-1:]]
-        gains = []
-        losses = []
+        Эквивалентно вызову combine_features на префиксах trades[:i+1], klines[:i+1],
+        oi_list[:i+1], liquidations[:i+1] (orderbook учитывается только на последнем шаге),
+        но за O(N) через накопленные суммы вместо O(N²).
         
-        for i in range(1, len(closes)):
-            change = closes[i] - closes[i-1]
-            if change > 0:
-                gains.append(change)
-                losses.append(0.0)
-            else:
-                gains.append(0.0)
-                losses.append(abs(change))
+        Args:
+            out: Предвыделенный массив shape (len(trades), num_features); признаки пишутся
+                в него по колонкам без промежуточного hstack
         
-        avg_gain = np.mean(gains) if gains else 0.0
-        avg_loss = np.mean(losses) if losses else 1e-10
+        Returns:
+            Массив shape (len(trades), num_features) (out, если передан)
+        """
+        if not isinstance(trades, TradeColumns):
+            trades = TradeColumns.from_trades(trades)
+        n = len(trades)
+        if out is None:
+            out = np.empty((n, self.NUM_FEATURES))
+        
+        if NUMBA_AVAILABLE and n:
+            _trade_prefix_kernel(trades.price, trades.size, trades.is_buy, trades.ts, out[:, 0:7])
+        else:
+            out[:, 0:7] = self._trade_prefix_features(trades)
+        out[:, 7:12] = 0.0
+        if n and orderbook:
+            out[-1, 7:12] = self.extract_from_orderbook(orderbook)
+        out[:, 12:20] = self._expand_prefix(self._kline_prefix_features(klines), n, 8)
+        out[:, 20:23] = self._expand_prefix(self._oi_prefix_features(oi_list), n, 3)
+        out[:, 23:26] = self._expand_prefix(self._liquidation_prefix_features(liquidations), n, 3)
+        return out
+    
+    def combine_features_windows(
+        self,
+        trades: Union[List[Dict], TradeColumns],
+        window: int,
+        orderbook: Optional[Dict] = None,
+        klines: Optional[Union[List[Dict], KlineColumns]] = None,
+        kline_bounds: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        combine_features для всех скользящих окон trades за один векторизованный проход.
         
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
-        return rsi / 100.0  # Нормализуем к [0, 1]
+        Строка s равна combine_features(trades[s:s+window], orderbook, klines[lo[s]:hi[s]], [], []),
+        где (lo, hi) = kline_bounds (окна без границ получают нулевые kline признаки). Суммы по окнам считаются через cumsum, так что
+        стоимость O(len(trades)) независимо от window. OI и ликвидации — нули.
+        
+        Returns:
+            Массив shape (len(trades) - window + 1, num_features)
+        """
+        if not isinstance(trades, TradeColumns):
+            trades = TradeColumns.from_trades(trades)
+        n_windows = len(trades) - window + 1
+        out = np.zeros((max(n_windows, 0), self.NUM_FEATURES))
+        if n_windows <= 0:
+            return out
+        
+        out[:, 0:7] = self._trade_window_features(trades, window)
+        if orderbook:
+            out[:, 7:12] = self.extract_from_orderbook(orderbook)
+        if klines is not None and kline_bounds is not None:
+            lo, hi = kline_bounds
+            m = min(n_windows, len(lo))
+            out[:m, 12:20] = self._kline_range_features(klines, lo[:m], hi[:m])
+        return out
     
-    def _calculate_macd(self, klines: List[Dict], fast: int = 12, slow: int = 26) -> float:
+    def _trade_window_features(self, trades: TradeColumns, window: int) -> np.ndarray:
+        """extract_from_trades(trades[s:s+window]) для всех s, shape (n - window + 1, 7)."""
+        if NUMBA_AVAILABLE:
+            # Точные суммы по каждому окну, окна распределены по ядрам (prange)
+            out = np.empty((len(trades) - window + 1, 7))
+            _trade_window_kernel(trades.price, trades.size, trades.is_buy, trades.ts, window, out)
+            return out
+        
+        # NumPy: суммы окон через разности cumsum, O(n) независимо от window
+        price = trades.price
+        size = trades.size
+        ends = np.arange(window, len(trades) + 1)
+        last = ends - 1
+        
+        buy_volume = self._window_sums(np.where(trades.is_buy, size, 0.0), ends, window)
+        total_volume = self._window_sums(size, ends, window)
+        sell_volume = total_volume - buy_volume
+        delta = (buy_volume - sell_volume) / np.maximum(total_volume, 1e-10)
+        aggression = size[last] / np.maximum(total_volume / window, 1e-10)
+        
+        if window >= 2:
+            ts = trades.ts
+            time_span = (ts[last] - ts[ends - window]) / 1000.0
+            trade_rate = window / np.maximum(time_span, 1.0)
+        else:
+            trade_rate = np.zeros(len(ends))
+        
+        return np.column_stack([price[last], size[last], buy_volume, sell_volume, delta, aggression, trade_rate])
+    
+    def _kline_range_features(
+        self,
+        klines: Union[List[Dict], KlineColumns],
+        lo: np.ndarray,
+        hi: np.ndarray,
+        period: int = 14,
+        slow: int = 26,
+    ) -> np.ndarray:
+        """extract_from_kline(klines[lo[s]:hi[s]]) для всех s, shape (len(lo), 8)."""
+        out = np.zeros((len(lo), 8))
+        prefix = self._kline_prefix_features(klines)
+        count = hi - lo
+        has = count > 0
+        if not len(prefix) or not has.any():
+            return out
+        
+        # Индикаторы окна совпадают с префиксными на его последней свече, если в окне
+        # хватает свечей; пороги проверяем по длине окна, а не префикса
+        rows = prefix[hi[has] - 1]
+        c = count[has]
+        rows[c < period, 5:] = 0.0
+        rows[c == period, 5] = 50.0
+        rows[c < slow, 6] = 0.0
+        out[has] = rows
+        return out
+    
+    @staticmethod
+    def _expand_prefix(prefix_features: np.ndarray, n: int, width: int) -> np.ndarray:
+        """Шаг i использует префикс длины min(i+1, len(source)); пустой источник -> нули."""
+        if len(prefix_features) == 0:
+            return np.zeros((n, width))
+        idx = np.minimum(np.arange(n), len(prefix_features) - 1)
+        return prefix_features[idx]
+    
+    @staticmethod
+    def _window_sums(values: np.ndarray, ends: np.ndarray, width: int) -> np.ndarray:
+        """Суммы values[end-width:end] для каждого end через cumsum."""
+        cs = np.concatenate(([0.0], np.cumsum(values)))
+        return cs[ends] - cs[ends - width]
+    
+    def _trade_prefix_features(self, trades: TradeColumns) -> np.ndarray:
+        """extract_from_trades(trades[:i+1]) для всех i, shape (n, 7)."""
+        n = len(trades)
+        if n == 0:
+            return np.zeros((0, 7))
+        
+        price = trades.price
+        size = trades.size
+        is_buy = trades.is_buy
+        ts = trades.ts.astype(np.float64)
+        
+        buy_volume = np.cumsum(np.where(is_buy, size, 0.0))
+        sell_volume = np.cumsum(np.where(is_buy, 0.0, size))
+        total_volume = buy_volume + sell_volume
+        delta = (buy_volume - sell_volume) / np.maximum(total_volume, 1e-10)
+        
+        count = np.arange(1, n + 1)
+        avg_size = np.cumsum(size) / count
+        aggression = size / np.maximum(avg_size, 1e-10)
+        
+        time_span = (ts - ts[0]) / 1000.0
+        trade_rate = count / np.maximum(time_span, 1.0)
+        trade_rate[0] = 0.0
+        
+        return np.column_stack([price, size, buy_volume, sell_volume, delta, aggression, trade_rate])
+    
+    def _kline_prefix_features(self, klines: Union[Sequence[Dict], KlineColumns], period: int = 14, fast: int = 12, slow: int = 26) -> np.ndarray:
+        """extract_from_kline(klines[:j+1]) для всех j, shape (n, 8)."""
+        n = len(klines)
+        if n == 0:
+            return np.zeros((0, 8))
+        
+        if not isinstance(klines, KlineColumns):
+            klines = KlineColumns.from_klines(klines)
+        ohlcv = np.column_stack([klines.open, klines.high, klines.low, klines.close, klines.volume])
+        closes = ohlcv[:, 3]
+        
+        if NUMBA_AVAILABLE:
+            indicators = np.empty((n, 3))
+            _kline_indicator_kernel(closes, period, fast, slow, indicators)
+            return np.hstack([ohlcv, indicators])
+        
+        lengths = np.arange(1, n + 1)
+        
+        # RSI: 50.0 при длине ровно period (как в _calculate_rsi), далее по последним period изменениям
+        rsi = np.full(n, 50.0)
+        rsi_ends = lengths[lengths >= period + 1]
+        if len(rsi_ends):
+            change = np.diff(closes)
+            gains = self._window_sums(np.maximum(change, 0.0), rsi_ends - 1, period)
+            losses = self._window_sums(np.maximum(-change, 0.0), rsi_ends - 1, period)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rs = (gains / period) / (losses / period)
+                rsi[rsi_ends - 1] = (100 - (100 / (1 + rs))) / 100.0
+        
+        # MACD: разница простых скользящих средних
+        macd = np.zeros(n)
+        macd_ends = lengths[lengths >= slow]
+        if len(macd_ends):
+            fast_ma = self._window_sums(closes, macd_ends, fast) / fast
+            slow_ma = self._window_sums(closes, macd_ends, slow) / slow
+            macd[macd_ends - 1] = (fast_ma - slow_ma) / np.maximum(slow_ma, 1e-10)
+        
+        price_change = np.zeros(n)
+        prev_close = closes[:-1]
+        price_change[1:] = (closes[1:] - prev_close) / np.maximum(prev_close, 1e-10)
+        
+        indicators = np.column_stack([rsi, macd, price_change])
+        indicators[lengths < period] = 0.0
+        
+        return np.hstack([ohlcv, indicators])
+    
+    def _oi_prefix_features(self, oi_list: Sequence[Dict]) -> np.ndarray:
+        """extract_from_open_interest(oi_list[:j+1]) для всех j, shape (n, 3)."""
+        n = len(oi_list)
+        if n == 0:
+            return np.zeros((0, 3))
+        
+        oi = np.fromiter((float(o.get("open_interest", 0)) for o in oi_list), dtype=np.float64, count=n)
+        oi_value = np.fromiter(
+            (
+                float(o.get("open_interest_value")) if o.get("open_interest_value") is not None else 0.0
+                for o in oi_list
+            ),
+            dtype=np.float64,
+            count=n,
+        )
+        oi_change = np.zeros(n)
+        oi_change[1:] = (oi[1:] - oi[:-1]) / np.maximum(oi[:-1], 1e-10)
+        
+        return np.column_stack([oi, oi_change, oi_value])
+    
+    def _liquidation_prefix_features(
+        self,
+        liquidations: Union[Sequence[Dict], LiquidationColumns],
+    ) -> np.ndarray:
+        """extract_from_liquidations(liquidations[:j+1]) для всех j, shape (n, 3)."""
+        n = len(liquidations)
+        if n == 0:
+            return np.zeros((0, 3))
+        
+        if not isinstance(liquidations, LiquidationColumns):
+            liquidations = LiquidationColumns.from_liquidations(liquidations)
+        quantity = liquidations.quantity
+        is_buy = liquidations.is_buy
+        ts = liquidations.ts.astype(np.float64)
+        
+        liq_volume = np.cumsum(quantity)
+        count = np.arange(1, n + 1)
+        liq_rate = count / np.maximum((ts - ts[0]) / 1000.0, 1.0)
+        liq_rate[0] = 0.0
+        buy_liq_ratio = np.cumsum(np.where(is_buy, quantity, 0.0)) / np.maximum(liq_volume, 1e-10)
+        
+        return np.column_stack([liq_volume, liq_rate, buy_liq_ratio])
+    
+    def _calculate_rsi(self, klines: Union[List[Dict], KlineColumns], period: int = 14) -> float:
+        """Упрощенный расчет RSI."""
+        if len(klines) < period + 1:
+            return 50.0
+        
+        if isinstance(klines, KlineColumns):
+            closes = np.ascontiguousarray(klines.close[-period-1:])
+        else:
+            closes = np.fromiter(
+                (float(k.get("close", 0)) for k in klines[-period-1:]),
+                dtype=np.float64,
+                count=period + 1,
+            )
+        return float(_rsi_core(closes, period))  # Нормализовано к [0, 1]
+    
+    def _calculate_macd(self, klines: Union[List[Dict], KlineColumns], fast: int = 12, slow: int = 26) -> float:
         """Упрощенный расчет MACD."""
         if len(klines) < slow:
             return 0.0
         
-        closes = [float(k.get("close", 0)) for k in klines[-slow:]]
-        
-        # Простое скользящее среднее
-        fast_ma = np.mean(closes[-fast:]) if len(closes) >= fast else np.mean(closes)
-        slow_ma = np.mean(closes)
-        
-        macd = (fast_ma - slow_ma) / max(slow_ma, 1e-10)
-        return macd
+        if isinstance(klines, KlineColumns):
+            closes = np.ascontiguousarray(klines.close[-slow:])
+        else:
+            closes = np.fromiter(
+                (float(k.get("close", 0)) for k in klines[-slow:]),
+                dtype=np.float64,
+                count=slow,
+            )
+        
+        # Простые скользящие средние за один проход
+        return float(_macd_core(closes, fast, slow))
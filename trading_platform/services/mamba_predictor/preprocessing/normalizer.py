@@ -3,7 +3,7 @@ Normalization utilities for feature vectors.
 """
 import numpy as np
 from typing import Optional, Tuple
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
+import json
 import pickle
 import os
 
@@ -21,19 +21,30 @@ class FeatureNormalizer:
         feature_stats: Optional[dict] = None,
     ):
         self.method = method
-        if method == "standard":
-            self.scaler = StandardScaler()
-        elif method == "minmax":
-            self.scaler = MinMaxScaler()
-        else:
-            raise ValueError(f"Unknown normalization method: {method}")
+        self.scaler = self._make_scaler(method)
         
         self.is_fitted = False
         self.feature_stats = feature_stats or {}
         
+        # transform = (X - _shift) / _div; кэшируется после fit/load
+        self._shift: Optional[np.ndarray] = None
+        self._div: Optional[np.ndarray] = None
+        
         if fit_on_init and feature_stats:
             self._load_stats()
     
+    @staticmethod
+    def _make_scaler(method: str):
+        """Необученный sklearn scaler для method."""
+        # sklearn тянет scipy (сотни мс и десятки MB RSS) — импорт только при создании
+        from sklearn.preprocessing import StandardScaler, MinMaxScaler
+        
+        if method == "standard":
+            return StandardScaler()
+        elif method == "minmax":
+            return MinMaxScaler()
+        raise ValueError(f"Unknown normalization method: {method}")
+    
     def fit(self, X: np.ndarray) -> None:
         """
         Обучение нормализатора на данных.
@@ -49,21 +60,38 @@ class FeatureNormalizer:
         
         self.scaler.fit(X_flat)
         self.is_fitted = True
+        self._cache_affine()
         
         # Сохраняем статистику
         if hasattr(self.scaler, "mean_"):
             self.feature_stats["mean"] = self.scaler.mean_.tolist()
             self.feature_stats["std"] = self.scaler.scale_.tolist()
-        if hasattr(self.scaler, "min_"):
-            self.feature_stats["min"] = self.scaler.min_.tolist()
+        if hasattr(self.scaler, "data_min_"):
+            self.feature_stats["min"] = self.scaler.data_min_.tolist()
             self.feature_stats["max"] = self.scaler.data_max_.tolist()
     
-    def transform(self, X: np.ndarray) -> np.ndarray:
+    def _cache_affine(self) -> None:
+        """Параметры transform как плоские массивы (n_features,) из состояния scaler."""
+        if self.method == "standard":
+            shift = self.scaler.mean_
+            div = self.scaler.scale_
+        else:
+            # MinMaxScaler с feature_range=(0, 1); нулевой диапазон -> 1, как в sklearn
+            shift = self.scaler.data_min_
+            div = np.where(self.scaler.data_range_ == 0, 1.0, self.scaler.data_range_)
+        self._shift = np.asarray(shift, dtype=np.float64)
+        self._div = np.asarray(div, dtype=np.float64)
+    
+    def transform(self, X: np.ndarray, inplace: bool = False) -> np.ndarray:
         """
         Нормализация данных.
         
+        Аффинное преобразование с broadcasting по последней оси: 3D батчи не
+        переформатируются, выход выделяется один раз (или не выделяется при inplace).
+        
         Args:
             X: Массив shape (n_samples, n_features) или (n_samples, seq_len, n_features)
+            inplace: Писать результат в X (X должен быть float массивом)
         
         Returns:
             Нормализованный массив той же формы
@@ -71,18 +99,13 @@ class FeatureNormalizer:
         if not self.is_fitted:
             raise ValueError("Normalizer must be fitted before transform")
         
-        original_shape = X.shape
-        
-        # Flatten для нормализации
-        if X.ndim == 3:
-            X_flat = X.reshape(-1, X.shape[-1])
+        if inplace:
+            out = X
         else:
-            X_flat = X
-        
-        X_normalized = self.scaler.transform(X_flat)
-        
-        # Восстанавливаем форму
-        return X_normalized.reshape(original_shape)
+            out = np.empty(X.shape, dtype=np.result_type(X.dtype, np.float32))
+        np.subtract(X, self._shift, out=out)
+        np.divide(out, self._div, out=out)
+        return out
     
     def fit_transform(self, X: np.ndarray) -> np.ndarray:
         """Обучение и нормализация."""
@@ -114,24 +137,83 @@ class FeatureNormalizer:
         return X_denormalized.reshape(original_shape)
     
     def save(self, path: str) -> None:
-        """Сохранение нормализатора."""
+        """
+        Сохранение нормализатора.
+        
+        Только массивы статистик в .npz (без pickle объекта sklearn): загрузка не
+        исполняет произвольный код и не требует совпадения версий sklearn.
+        """
         os.makedirs(os.path.dirname(path), exist_ok=True)
+        empty = np.array([], dtype=np.float64)
+        # Через файловый объект — np.savez иначе дописывает .npz к пути
         with open(path, "wb") as f:
-            pickle.dump({
-                "scaler": self.scaler,
-                "method": self.method,
-                "is_fitted": self.is_fitted,
-                "feature_stats": self.feature_stats,
-            }, f)
+            np.savez(
+                f,
+                method=np.array(self.method),
+                is_fitted=np.array(self.is_fitted),
+                mean=getattr(self.scaler, "mean_", empty),
+                scale=getattr(self.scaler, "scale_", empty),
+                data_min=getattr(self.scaler, "data_min_", empty),
+                data_max=getattr(self.scaler, "data_max_", empty),
+                feature_stats=np.array(json.dumps(self.feature_stats)),
+            )
     
     def load(self, path: str) -> None:
-        """Загрузка нормализатора."""
+        """Загрузка нормализатора (.npz; старые pickle-файлы читаются как раньше)."""
+        try:
+            data = np.load(path, allow_pickle=False)
+        except ValueError:
+            self._load_pickle(path)
+            return
+        
+        with data:
+            method = str(data["method"])
+            is_fitted = bool(data["is_fitted"])
+            self.feature_stats = json.loads(str(data["feature_stats"]))
+            arrays = {k: data[k] for k in ("mean", "scale", "data_min", "data_max")}
+        
+        self.method = method
+        self.scaler = self._make_scaler(method)
+        self.is_fitted = False
+        if not is_fitted:
+            return
+        if method == "standard":
+            self._restore_standard(arrays["mean"], arrays["scale"])
+        else:
+            self._restore_minmax(arrays["data_min"], arrays["data_max"])
+    
+    def _load_pickle(self, path: str) -> None:
+        """Загрузка нормализатора, сохраненного pickle (до перехода на .npz)."""
         with open(path, "rb") as f:
             data = pickle.load(f)
             self.scaler = data["scaler"]
             self.method = data["method"]
             self.is_fitted = data["is_fitted"]
             self.feature_stats = data.get("feature_stats", {})
+        if self.is_fitted:
+            self._cache_affine()
+    
+    def _restore_standard(self, mean: np.ndarray, std: np.ndarray) -> None:
+        """Восстановление обученного StandardScaler по mean/std."""
+        self.scaler.mean_ = mean
+        self.scaler.scale_ = std
+        self.scaler.var_ = std ** 2
+        self.scaler.n_features_in_ = len(mean)
+        self.is_fitted = True
+        self._cache_affine()
+    
+    def _restore_minmax(self, min_vals: np.ndarray, max_vals: np.ndarray) -> None:
+        """Восстановление обученного MinMaxScaler по min/max."""
+        data_range = max_vals - min_vals
+        scale = 1.0 / np.where(data_range == 0, 1.0, data_range)
+        self.scaler.scale_ = scale
+        self.scaler.min_ = -min_vals * scale
+        self.scaler.data_max_ = max_vals
+        self.scaler.data_min_ = min_vals
+        self.scaler.data_range_ = data_range
+        self.scaler.n_features_in_ = len(min_vals)
+        self.is_fitted = True
+        self._cache_affine()
     
     def _load_stats(self) -> None:
         """Загрузка статистики из feature_stats."""
@@ -139,22 +221,15 @@ class FeatureNormalizer:
             return
         
         if self.method == "standard" and "mean" in self.feature_stats:
-            # Восстанавливаем StandardScaler
-            mean = np.array(self.feature_stats["mean"])
-            std = np.array(self.feature_stats["std"])
-            self.scaler.mean_ = mean
-            self.scaler.scale_ = std
-            self.scaler.var_ = std ** 2
-            self.is_fitted = True
+            self._restore_standard(
+                np.array(self.feature_stats["mean"]),
+                np.array(self.feature_stats["std"]),
+            )
         elif self.method == "minmax" and "min" in self.feature_stats:
-            # Восстанавливаем MinMaxScaler
-            min_vals = np.array(self.feature_stats["min"])
-            max_vals = np.array(self.feature_stats["max"])
-            self.scaler.min_ = min_vals
-            self.scaler.data_max_ = max_vals
-            self.scaler.data_min_ = min_vals
-            self.scaler.data_range_ = max_vals - min_vals
-            self.is_fitted = True
+            self._restore_minmax(
+                np.array(self.feature_stats["min"]),
+                np.array(self.feature_stats["max"]),
+            )
 
 
 class SimpleNormalizer:
@@ -43,6 +43,9 @@ def test_mamba_model():
     
     model.eval()
     
+    # На GPU — bf16 autocast (SSM kernels и Linear на tensor cores); на CPU — fp32
+    use_bf16 = device.type == "cuda" and torch.cuda.is_bf16_supported()
+    
     # Генерируем синтетические данные (имитация рыночных данных)
     batch_size = 1
     dummy_data = torch.randn(batch_size, SEQUENCE_LENGTH, INPUT_FEATURES).to(device)
@@ -50,8 +53,8 @@ def test_mamba_model():
     print(f"Input shape: {dummy_data.shape}")
     
     # Forward pass
-    with torch.no_grad():
-        output = model(dummy_data)
+    with torch.no_grad(), torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
+        output = model(dummy_data).float()
         print(f"Output shape: {output.shape}")
         print(f"Output: {output.cpu().numpy()}")
     
@@ -70,10 +73,10 @@ def test_mamba_model():
         
         multi_model.eval()
         
-        with torch.no_grad():
+        with torch.no_grad(), torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
             output = multi_model(dummy_data)
-            direction_probs = output["direction"].cpu().numpy()[0]
-            predicted_price = output["price"].cpu().numpy()[0]
+            direction_probs = torch.softmax(output["direction"].float(), dim=1).cpu().numpy()[0]
+            predicted_price = output["price"].float().cpu().numpy()[0]
             
             print(f"Direction probabilities: Long={direction_probs[0]:.2%}, Short={direction_probs[1]:.2%}")
             print(f"Predicted price: {predicted_price:.2f}")
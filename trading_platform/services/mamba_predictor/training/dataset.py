@@ -4,10 +4,14 @@ Dataset for training Mamba models on historical data.
 import torch
 from torch.utils.data import Dataset
 import numpy as np
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import json
-import asyncpg
-import redis.asyncio as redis
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads  # stdlib тоже принимает bytes
 
 
 class TradingDataset(Dataset):
@@ -20,16 +24,24 @@ class TradingDataset(Dataset):
         features: np.ndarray,
         directions: np.ndarray,
         prices: np.ndarray,
+        features_dtype: torch.dtype = torch.float32,
     ):
         """
         Args:
             features: Массив признаков shape (n_samples, seq_len, n_features)
             directions: Массив направлений shape (n_samples,) - 0 = short, 1 = long
             prices: Массив цен shape (n_samples,) - целевая цена для регрессии
+            features_dtype: dtype хранения признаков; torch.bfloat16 вдвое сокращает память
+                и H2D трафик, модель должна работать под bf16 autocast
         """
-        self.features = torch.tensor(features, dtype=torch.float32)
-        self.directions = torch.tensor(directions, dtype=torch.long)
-        self.prices = torch.tensor(prices, dtype=torch.float32)
+        # from_numpy делит память с массивами (копия только при смене dtype/layout),
+        # без второго полного экземпляра признаков на время загрузки
+        self.features = torch.from_numpy(np.ascontiguousarray(features, dtype=np.float32))
+        if features_dtype != torch.float32:
+            # Приведение один раз при создании, а не в каждом __getitem__
+            self.features = self.features.to(features_dtype)
+        self.directions = torch.from_numpy(np.ascontiguousarray(directions, dtype=np.int64))
+        self.prices = torch.from_numpy(np.ascontiguousarray(prices, dtype=np.float32))
     
     def __len__(self) -> int:
         return len(self.features)
@@ -42,6 +54,48 @@ class TradingDataset(Dataset):
         }
 
 
+# Строка бинарного COPY (SELECT ts, price, size, is_buy): int16 число полей, затем
+# для каждого поля int32 длина и значение; все big-endian, NOT NULL колонки -> без -1 длин
+_COPY_TRADE_ROW = np.dtype([
+    ("n_fields", ">i2"),
+    ("ts_len", ">i4"), ("ts", ">i8"),
+    ("price_len", ">i4"), ("price", ">f8"),
+    ("size_len", ">i4"), ("size", ">f8"),
+    ("is_buy_len", ">i4"), ("is_buy", "u1"),
+])
+
+
+def _parse_copy_binary(buf: bytes, row_dtype: np.dtype) -> np.ndarray:
+    """
+    Разбор вывода COPY ... (FORMAT binary) с фиксированной длиной строки одним frombuffer.
+    
+    Заголовок: сигнатура PGCOPY (11 байт), flags (4), длина расширения (4) + расширение;
+    в конце — int16 -1.
+    """
+    if not buf:
+        return np.empty(0, dtype=row_dtype)
+    if buf[:11] != b"PGCOPY\n\xff\r\n\x00":
+        raise ValueError("Unexpected COPY binary header")
+    offset = 19 + int.from_bytes(buf[15:19], "big")
+    count = (len(buf) - offset - 2) // row_dtype.itemsize
+    return np.frombuffer(buf, dtype=row_dtype, offset=offset, count=count)
+
+
+def _next_trade_targets(prices: np.ndarray, sequence_length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Целевые значения для сэмплов i = sequence_length..len(prices)-1 одним сравнением массивов.
+    
+    direction = 1, если цена следующей сделки выше текущей; target — цена следующей сделки.
+    У последнего сэмпла следующей сделки нет: direction = 0, target — его собственная цена.
+    """
+    current = prices[sequence_length:]
+    directions = np.zeros(len(current), dtype=np.int64)
+    directions[:-1] = current[1:] > current[:-1]
+    targets = current.copy()
+    targets[:-1] = current[1:]
+    return directions, targets
+
+
 async def load_data_from_redis(
     redis_url: str,
     exchange: str,
@@ -55,7 +109,10 @@ async def load_data_from_redis(
     Returns:
         (features, directions, prices) - numpy arrays
     """
-    r = redis.from_url(redis_url, decode_responses=True)
+    import redis.asyncio as redis
+    
+    # Сырые bytes: парсер JSON принимает их напрямую, без UTF-8 decode каждого сообщения
+    r = redis.from_url(redis_url, decode_responses=False)
     
     # Загружаем данные из Redis Streams
     from shared.streams import (
@@ -64,7 +121,11 @@ async def load_data_from_redis(
         STREAM_OPEN_INTEREST,
         REDIS_KEY_DOM,
     )
-    from services.mamba_predictor.preprocessing.feature_extractor import MarketFeatureExtractor
+    from services.mamba_predictor.preprocessing.feature_extractor import (
+        MarketFeatureExtractor,
+        TradeColumns,
+        KlineColumns,
+    )
     
     extractor = MarketFeatureExtractor()
     
@@ -72,10 +133,10 @@ async def load_data_from_redis(
     trades_messages = await r.xrevrange(STREAM_TRADES, count=limit * 2)
     trades = []
     for _mid, fields in trades_messages or []:
-        payload_str = (fields or {}).get("payload")
+        payload_str = (fields or {}).get(b"payload")
         if payload_str:
             try:
-                trade = json.loads(payload_str)
+                trade = _json_loads(payload_str)
                 if trade.get("exchange") == exchange and trade.get("symbol") == symbol:
                     trades.append(trade)
             except:
@@ -85,10 +146,10 @@ async def load_data_from_redis(
     kline_messages = await r.xrevrange(STREAM_KLINE, count=limit * 2)
     klines = []
     for _mid, fields in kline_messages or []:
-        payload_str = (fields or {}).get("payload")
+        payload_str = (fields or {}).get(b"payload")
         if payload_str:
             try:
-                kline = json.loads(payload_str)
+                kline = _json_loads(payload_str)
                 if kline.get("exchange") == exchange and kline.get("symbol") == symbol:
                     klines.append(kline)
             except:
@@ -98,58 +159,37 @@ async def load_data_from_redis(
     trades.sort(key=lambda x: x.get("ts", 0))
     klines.sort(key=lambda x: x.get("start", 0))
     
-    # Создаем последовательности
-    features_list = []
-    directions_list = []
-    prices_list = []
-    
-    for i in range(sequence_length, len(trades)):
-        # Берем окно данных
-        trades_window = trades[i - sequence_length:i]
-        kline_window = [k for k in klines if trades[i - sequence_length].get("ts", 0) <= k.get("start", 0) <= trades[i].get("ts", 0)]
-        
-        # Получаем текущий orderbook (упрощенно - используем последний)
-        dom_key = REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)
-        dom_raw = await r.get(dom_key)
-        orderbook = None
-        if dom_raw:
-            try:
-                orderbook = json.loads(dom_raw)
-            except:
-                pass
-        
-        # Извлекаем признаки
-        features = extractor.combine_features(
-            trades=trades_window,
-            orderbook=orderbook,
-            klines=kline_window,
-            oi_list=[],
-            liquidations=[],
-        )
-        
-        # Определяем направление (сравниваем текущую цену с будущей)
-        if i < len(trades) - 1:
-            current_price = float(trades[i].get("price", 0))
-            future_price = float(trades[i + 1].get("price", 0))
-            direction = 1 if future_price > current_price else 0
-            target_price = future_price
-        else:
-            direction = 0
-            target_price = float(trades[i].get("price", 0))
-        
-        features_list.append(features)
-        directions_list.append(direction)
-        prices_list.append(target_price)
+    # Получаем текущий orderbook (упрощенно - один снапшот для всех окон)
+    dom_key = REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)
+    dom_raw = await r.get(dom_key)
+    orderbook = None
+    if dom_raw:
+        try:
+            orderbook = _json_loads(dom_raw)
+        except:
+            pass
     
     await r.aclose()
     
-    if not features_list:
+    n_samples = len(trades) - sequence_length
+    if n_samples <= 0:
         return np.array([]), np.array([]), np.array([])
     
-    # Преобразуем в массивы
-    features_array = np.array(features_list)
-    directions_array = np.array(directions_list)
-    prices_array = np.array(prices_list)
+    # Признаки всех окон одним векторизованным вызовом: trades[i - sequence_length:i]
+    # и свечи со start в [ts(trades[i - sequence_length]), ts(trades[i])]
+    trade_cols = TradeColumns.from_trades(trades)
+    kline_starts = np.fromiter((k.get("start", 0) for k in klines), dtype=np.int64, count=len(klines))
+    kline_lo = np.searchsorted(kline_starts, trade_cols.ts[:n_samples], side="left")
+    kline_hi = np.searchsorted(kline_starts, trade_cols.ts[sequence_length:], side="right")
+    features_array = extractor.combine_features_windows(
+        trades=trade_cols,
+        window=sequence_length,
+        orderbook=orderbook,
+        klines=KlineColumns.from_klines(klines),
+        kline_bounds=(kline_lo, kline_hi),
+    )[:n_samples]
+    
+    directions_array, prices_array = _next_trade_targets(trade_cols.price, sequence_length)
     
     return features_array, directions_array, prices_array
 
@@ -168,11 +208,17 @@ async def load_data_from_postgres(
     Returns:
         (features, directions, prices) - numpy arrays
     """
+    import asyncpg
+    
     conn = await asyncpg.connect(db_url)
     
     try:
-        # Загружаем trades
-        query = "SELECT side, price, size, ts FROM trades WHERE exchange=$1 AND symbol=$2"
+        # Загружаем trades бинарным COPY: строки разбираются в колонки NumPy без
+        # промежуточных Record/dict; сторона сделки сводится к bool на стороне БД
+        query = (
+            "SELECT ts, price, size, lower(left(side, 1)) = 'b' "
+            "FROM trades WHERE exchange=$1 AND symbol=$2"
+        )
         params = [exchange, symbol]
         
         if from_ts:
@@ -184,58 +230,43 @@ async def load_data_from_postgres(
         
         query += " ORDER BY ts LIMIT 50000"
         
-        rows = await conn.fetch(query, *params)
-        trades = [
-            {
-                "side": r["side"],
-                "price": float(r["price"]),
-                "size": float(r["size"]),
-                "ts": r["ts"],
-            }
-            for r in rows
-        ]
+        chunks: List[bytes] = []
+        
+        async def _sink(data: bytes) -> None:
+            chunks.append(data)
+        
+        await conn.copy_from_query(query, *params, output=_sink, format="binary")
         
     finally:
         await conn.close()
     
     # Аналогично load_data_from_redis, создаем последовательности
     # (упрощенная версия - в реальности нужна более сложная логика)
-    from services.mamba_predictor.preprocessing.feature_extractor import MarketFeatureExtractor
+    from services.mamba_predictor.preprocessing.feature_extractor import (
+        MarketFeatureExtractor,
+        TradeColumns,
+    )
     
     extractor = MarketFeatureExtractor()
-    features_list = []
-    directions_list = []
-    prices_list = []
     
-    for i in range(sequence_length, len(trades)):
-        trades_window = trades[i - sequence_length:i]
-        
-        features = extractor.combine_features(
-            trades=trades_window,
-            orderbook=None,
-            klines=[],
-            oi_list=[],
-            liquidations=[],
-        )
-        
-        if i < len(trades) - 1:
-            current_price = trades[i]["price"]
-            future_price = trades[i + 1]["price"]
-            direction = 1 if future_price > current_price else 0
-            target_price = future_price
-        else:
-            direction = 0
-            target_price = trades[i]["price"]
-        
-        features_list.append(features)
-        directions_list.append(direction)
-        prices_list.append(target_price)
+    rows = _parse_copy_binary(b"".join(chunks), _COPY_TRADE_ROW)
+    trade_cols = TradeColumns(
+        price=rows["price"].astype(np.float64),
+        size=rows["size"].astype(np.float64),
+        is_buy=rows["is_buy"].astype(bool),
+        ts=rows["ts"].astype(np.int64),
+    )
     
-    if not features_list:
+    n_samples = len(trade_cols) - sequence_length
+    if n_samples <= 0:
         return np.array([]), np.array([]), np.array([])
     
-    features_array = np.array(features_list)
-    directions_array = np.array(directions_list)
-    prices_array = np.array(prices_list)
+    # Признаки всех окон trades[i - sequence_length:i] одним векторизованным вызовом
+    features_array = extractor.combine_features_windows(
+        trades=trade_cols,
+        window=sequence_length,
+    )[:n_samples]
+    
+    directions_array, prices_array = _next_trade_targets(trade_cols.price, sequence_length)
     
     return features_array, directions_array, prices_array
@@ -3,7 +3,6 @@ Metrics for model evaluation.
 """
 import numpy as np
 import torch
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, mean_absolute_error, mean_squared_error
 from typing import Dict, Tuple
 
 
@@ -21,10 +20,21 @@ def calculate_direction_metrics(
     Returns:
         Словарь с метриками
     """
-    accuracy = accuracy_score(y_true, y_pred)
-    precision = precision_score(y_true, y_pred, average="binary", zero_division=0)
-    recall = recall_score(y_true, y_pred, average="binary", zero_division=0)
-    f1 = f1_score(y_true, y_pred, average="binary", zero_division=0)
+    # Матрица ошибок 2x2 одним bincount по коду 2*true + pred вместо четырех проходов sklearn
+    cm = np.bincount(
+        (np.asarray(y_true, dtype=np.int64) << 1) | np.asarray(y_pred, dtype=np.int64),
+        minlength=4,
+    )
+    return _direction_metrics_from_counts(*cm[:4])
+
+
+def _direction_metrics_from_counts(tn: int, fp: int, fn: int, tp: int) -> Dict[str, float]:
+    """Метрики направления по матрице ошибок; 0 при нулевом знаменателе (zero_division=0)."""
+    total = tn + fp + fn + tp
+    accuracy = (tp + tn) / total if total else 0.0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
     
     return {
         "accuracy": float(accuracy),
@@ -48,13 +58,20 @@ def calculate_price_metrics(
     Returns:
         Словарь с метриками
     """
-    mae = mean_absolute_error(y_true, y_pred)
-    mse = mean_squared_error(y_true, y_pred)
+    y_true = np.asarray(y_true, dtype=np.float64)
+    # Один буфер ошибки, дальше все in-place: |e| -> MAE, |e|^2 -> MSE
+    err = np.subtract(y_true, y_pred, dtype=np.float64)
+    np.abs(err, out=err)
+    mae = err.mean()
+    
+    # MAPE (Mean Absolute Percentage Error); сэмплы с нулевой ценой дают 0, а не |e| / 1e-10
+    ape = np.divide(err, np.abs(y_true), out=np.zeros_like(err), where=y_true != 0)
+    mape = ape.mean() * 100
+    
+    np.square(err, out=err)
+    mse = err.mean()
     rmse = np.sqrt(mse)
     
-    # MAPE (Mean Absolute Percentage Error)
-    mape = np.mean(np.abs((y_true - y_pred) / (y_true + 1e-10))) * 100
-    
     return {
         "mae": float(mae),
         "mse": float(mse),
@@ -84,6 +101,54 @@ def calculate_combined_metrics(
     }
 
 
+class MetricAccumulator:
+    """
+    Накопление метрик валидации на device без синхронизаций по ходу прохода.
+    
+    Хранит матрицу ошибок направления и суммы ошибок цены тензорами на device;
+    на хост переносится только итог в compute(). Результат совпадает с
+    calculate_combined_metrics по всем сэмплам.
+    """
+    
+    def __init__(self, device: torch.device):
+        # tn, fp, fn, tp — индекс 2*true + pred
+        self.confusion = torch.zeros(4, dtype=torch.long, device=device)
+        # сумма |e|, сумма e^2, сумма |e / true|
+        self.price_sums = torch.zeros(3, dtype=torch.float64, device=device)
+        self.count = 0
+    
+    def update(
+        self,
+        direction_logits: torch.Tensor,
+        direction_true: torch.Tensor,
+        price_pred: torch.Tensor,
+        price_true: torch.Tensor,
+    ) -> None:
+        direction_pred = torch.argmax(direction_logits, dim=1)
+        self.confusion += torch.bincount(direction_true * 2 + direction_pred, minlength=4)[:4]
+        
+        err = (price_pred - price_true).double()
+        self.price_sums[0] += err.abs().sum()
+        self.price_sums[1] += err.square().sum()
+        # MAPE как в calculate_price_metrics: нулевая цена -> вклад 0
+        true = price_true.double()
+        self.price_sums[2] += torch.where(true != 0, err.abs() / true.abs(), torch.zeros_like(err)).sum()
+        self.count += len(price_true)
+    
+    def compute(self) -> Dict[str, float]:
+        tn, fp, fn, tp = self.confusion.tolist()
+        sae, sse, sape = self.price_sums.tolist()
+        n = max(self.count, 1)
+        mse = sse / n
+        return {
+            **_direction_metrics_from_counts(tn, fp, fn, tp),
+            "mae": sae / n,
+            "mse": mse,
+            "rmse": float(np.sqrt(mse)),
+            "mape": sape / n * 100,
+        }
+
+
 def evaluate_model(
     model: torch.nn.Module,
     dataloader: torch.utils.data.DataLoader,
@@ -101,46 +166,19 @@ def evaluate_model(
         Словарь с метриками
     """
     model.eval()
-    
-    all_direction_true = []
-    all_direction_pred = []
-    all_price_true = []
-    all_price_pred = []
+    metrics = MetricAccumulator(device)
+    # Тот же bf16 autocast, что в train_model: на таком GPU TradingDataset отдает bf16 признаки,
+    # fp32 модель без autocast на них падает (dtype mismatch в первом Linear)
+    use_bf16 = device.type == "cuda" and torch.cuda.is_bf16_supported()
     
     with torch.no_grad():
         for batch in dataloader:
-            x = batch["features"].to(device)
-            direction_true = batch["direction"].to(device)
-            price_true = batch["price"].to(device)
-            
-            output = model(x)
+            x = batch["features"].to(device, non_blocking=True)
+            direction_true = batch["direction"].to(device, non_blocking=True)
+            price_true = batch["price"].to(device, non_blocking=True)
             
-            # Direction predictions
-            direction_probs = output["direction"]
-            direction_pred = torch.argmax(direction_probs, dim=1).cpu().numpy()
-            direction_true_np = direction_true.cpu().numpy()
-            
-            # Price predictions
-            price_pred = output["price"].cpu().numpy()
-            price_true_np = price_true.cpu().numpy()
-            
-            all_direction_true.extend(direction_true_np)
-            all_direction_pred.extend(direction_pred)
-            all_price_true.extend(price_true_np)
-            all_price_pred.extend(price_pred)
-    
-    # Преобразуем в numpy массивы
-    direction_true_arr = np.array(all_direction_true)
-    direction_pred_arr = np.array(all_direction_pred)
-    price_true_arr = np.array(all_price_true)
-    price_pred_arr = np.array(all_price_pred)
-    
-    # Рассчитываем метрики
-    metrics = calculate_combined_metrics(
-        direction_true_arr,
-        direction_pred_arr,
-        price_true_arr,
-        price_pred_arr,
-    )
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=use_bf16):
+                output = model(x)
+            metrics.update(output["direction"], direction_true, output["price"], price_true)
     
-    return metrics
+    return metrics.compute()
@@ -3,11 +3,14 @@ Market context builder: reads tape, heatmap, footprint, events, scores from Redi
 aggregates into structured text for LLM prompts, caches in Redis (ai:context:{exchange}:{symbol}).
 """
 import asyncio
-import json
 import argparse
+import functools
+import math
 import os
 import sys
-from datetime import datetime
+import time
+
+import orjson
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -31,29 +34,118 @@ from shared.streams import (
 HEATMAP_LAST_N = 10
 FOOTPRINT_LAST_N = 10
 EVENTS_LAST_N = 20
+# Сколько пар run_worker обновляет одновременно (pipeline на пару держит одно соединение)
+WORKER_CONCURRENCY = 32
+# Пара без новых данных дольше этого срока удаляется из ai:active_pairs (API вернет ее при snapshot)
+STALE_PAIR_SEC = 600
+
+
+# Диапазон datetime (годы 1..9999): вне него, как и с utcfromtimestamp, отдаем str(ts)
+_MIN_SEC = -62135596800
+_MAX_SEC = 253402300800
+
+
+@functools.lru_cache(maxsize=8192)
+def _sec_to_hms(sec: int) -> str:
+    # UTC время суток без datetime/struct_time; в снапшоте много событий в одну секунду
+    return "%02d:%02d:%02d" % ((sec // 3600) % 24, (sec // 60) % 60, sec % 60)
 
 
 def _ts_to_str(ts: int) -> str:
     if not ts:
         return ""
     try:
-        if ts > 1e12:
-            ts = ts / 1000.0
-        return datetime.utcfromtimestamp(ts).strftime("%H:%M:%S")
+        sec = int(ts // 1000) if ts > 1e12 else int(ts // 1)
+        if not _MIN_SEC <= sec < _MAX_SEC:
+            return str(ts)
+        return _sec_to_hms(sec)
     except Exception:
         return str(ts)
 
 
+@functools.lru_cache(maxsize=2048)
+def _keys_for(exchange: str, symbol: str) -> tuple:
+    """Ключи чтения контекста пары в порядке запросов pipeline (форматируются один раз)."""
+    return tuple(
+        template.format(exchange=exchange, symbol=symbol)
+        for template in (
+            REDIS_KEY_TAPE,
+            REDIS_KEY_HEATMAP,
+            REDIS_KEY_FOOTPRINT,
+            REDIS_KEY_EVENTS,
+            REDIS_KEY_SCORES_TREND,
+            REDIS_KEY_SCORES_EXHAUSTION,
+            REDIS_KEY_MAMBA_SIGNAL,
+            REDIS_KEY_SIGNALS_RULE,
+        )
+    )
+
+
+@functools.lru_cache(maxsize=2048)
+def _context_key(exchange: str, symbol: str) -> str:
+    return REDIS_KEY_AI_CONTEXT.format(exchange=exchange, symbol=symbol)
+
+
+def _heatmap_totals(rows) -> tuple:
+    """(число уровней, сумма vol_bid, сумма vol_ask) среза heatmap.
+
+    Колоночный формат {"px": [...], "vol_bid": [...], "vol_ask": [...]} суммируется без
+    обхода dict'ов; список строк [{"vol_bid": ..., "vol_ask": ...}] поддерживается как раньше.
+    """
+    if isinstance(rows, dict):
+        bids = rows.get("vol_bid") or []
+        asks = rows.get("vol_ask") or []
+        return len(rows.get("px") or bids), math.fsum(bids), math.fsum(asks)
+    return (
+        len(rows),
+        math.fsum([row.get("vol_bid", 0) for row in rows]),
+        math.fsum([row.get("vol_ask", 0) for row in rows]),
+    )
+
+
 async def build_market_context(r: redis.Redis, exchange: str, symbol: str) -> str:
     """Read Redis keys for (exchange, symbol), return single structured text."""
+    results = await _fetch(r, exchange, symbol)
+    # Разбор JSON и сборка текста — CPU; в потоке, чтобы не держать event loop для других пар
+    return await asyncio.to_thread(_build_text, results)
+
+
+async def _fetch(r: redis.Redis, exchange: str, symbol: str) -> list:
+    """Сырые ответы Redis для контекста пары в порядке _keys_for."""
+    # Все чтения одним pipeline (один round-trip вместо восьми); без MULTI — атомарность не нужна
+    tape_key, heatmap_key, fp_key, events_key, trend_key, exh_key, mamba_key, sig_key = _keys_for(
+        exchange, symbol
+    )
+    pipe = r.pipeline(transaction=False)
+    pipe.get(tape_key)
+    pipe.lrange(heatmap_key, -HEATMAP_LAST_N, -1)
+    pipe.lrange(fp_key, -FOOTPRINT_LAST_N, -1)
+    pipe.lrange(events_key, -EVENTS_LAST_N, -1)
+    pipe.lrange(trend_key, -min(SCORES_MAXLEN, 10), -1)
+    pipe.lrange(exh_key, -min(SCORES_MAXLEN, 10), -1)
+    pipe.get(mamba_key)
+    pipe.lrange(sig_key, -min(SIGNALS_MAXLEN, 5), -1)
+    return await pipe.execute()
+
+
+def _build_text(results: list) -> str:
+    """Текст контекста из ответов _fetch (без I/O)."""
     parts = []
+    (
+        tape_raw,
+        heatmap_items,
+        fp_items,
+        events_items,
+        trend_items,
+        exh_items,
+        mamba_raw,
+        sig_items,
+    ) = results
 
     # Tape (current aggregates + last trade)
-    tape_key = REDIS_KEY_TAPE.format(exchange=exchange, symbol=symbol)
-    tape_raw = await r.get(tape_key)
     if tape_raw:
         try:
-            tape = json.loads(tape_raw)
+            tape = orjson.loads(tape_raw)
             parts.append("=== TAPE (order flow) ===")
             parts.append(f"Last update: {_ts_to_str(tape.get('ts', 0))}")
             agg = tape.get("aggregates", {})
@@ -66,37 +158,31 @@ async def build_market_context(r: redis.Redis, exchange: str, symbol: str) -> st
                 large = " [LARGE]" if lt.get("large") else ""
                 parts.append(f"  Last trade: {lt.get('side')} {lt.get('price')} size={lt.get('size')}{large}")
             parts.append("")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             pass
 
     # Heatmap: last N slices summary
-    heatmap_key = REDIS_KEY_HEATMAP.format(exchange=exchange, symbol=symbol)
-    heatmap_items = await r.lrange(heatmap_key, -HEATMAP_LAST_N, -1)
     if heatmap_items:
         parts.append("=== HEATMAP (last slices) ===")
         for raw in heatmap_items[-5:]:
             try:
-                s = json.loads(raw)
+                s = orjson.loads(raw)
                 ts = s.get("ts", 0)
-                rows = s.get("rows", [])
-                total_bid = sum(r.get("vol_bid", 0) for r in rows)
-                total_ask = sum(r.get("vol_ask", 0) for r in rows)
-                parts.append(f"  {_ts_to_str(ts)} rows={len(rows)} vol_bid={total_bid:.0f} vol_ask={total_ask:.0f}")
-            except (json.JSONDecodeError, TypeError):
+                n_rows, total_bid, total_ask = _heatmap_totals(s.get("rows", []))
+                parts.append(f"  {_ts_to_str(ts)} rows={n_rows} vol_bid={total_bid:.0f} vol_ask={total_ask:.0f}")
+            except (orjson.JSONDecodeError, TypeError):
                 continue
         parts.append("")
 
     # Footprint: last N bars (delta, POC, Imbalance)
-    fp_key = REDIS_KEY_FOOTPRINT.format(exchange=exchange, symbol=symbol)
-    fp_items = await r.lrange(fp_key, -FOOTPRINT_LAST_N, -1)
     if fp_items:
         parts.append("=== FOOTPRINT (last bars) ===")
         for raw in fp_items[-5:]:
             try:
-                bar = json.loads(raw)
+                bar = orjson.loads(raw)
                 start = bar.get("start", 0)
                 levels = bar.get("levels", [])
-                delta_sum = sum(l.get("delta", 0) for l in levels)
+                delta_sum = math.fsum([l.get("delta", 0) for l in levels])
                 line = f"  {_ts_to_str(start)} levels={len(levels)} bar_delta={delta_sum:.0f}"
                 poc = bar.get("poc_price")
                 if poc is not None:
@@ -105,85 +191,75 @@ async def build_market_context(r: redis.Redis, exchange: str, symbol: str) -> st
                 if imb:
                     line += " imbalance=[" + ", ".join(f"{x.get('side')}@{x.get('price')} {x.get('ratio')}x" for x in imb[:3]) + "]"
                 parts.append(line)
-            except (json.JSONDecodeError, TypeError):
+            except (orjson.JSONDecodeError, TypeError):
                 continue
         parts.append("")
 
     # Events (iceberg, wall, spoof, etc.)
-    events_key = REDIS_KEY_EVENTS.format(exchange=exchange, symbol=symbol)
-    events_items = await r.lrange(events_key, -EVENTS_LAST_N, -1)
     if events_items:
         parts.append("=== EVENTS ===")
         for raw in events_items[-10:]:
             try:
-                e = json.loads(raw)
+                e = orjson.loads(raw)
                 etype = e.get("type", "?")
                 ts = e.get("ts", e.get("ts_start", 0))
                 price = e.get("price")
                 side = e.get("side", "")
                 vol = e.get("volume", "")
                 parts.append(f"  {_ts_to_str(ts)} {etype} price={price} side={side} vol={vol}")
-            except (json.JSONDecodeError, TypeError):
+            except (orjson.JSONDecodeError, TypeError):
                 continue
         parts.append("")
 
     # Trend scores
-    trend_key = REDIS_KEY_SCORES_TREND.format(exchange=exchange, symbol=symbol)
-    trend_items = await r.lrange(trend_key, -min(SCORES_MAXLEN, 10), -1)
     if trend_items:
         parts.append("=== TREND SCORES ===")
         for raw in trend_items[-5:]:
             try:
-                s = json.loads(raw)
+                s = orjson.loads(raw)
                 parts.append(
                     f"  {_ts_to_str(s.get('ts'))} trend_power={s.get('trend_power', 0):.3f} delta={s.get('trend_power_delta', 0):.3f}"
                 )
-            except (json.JSONDecodeError, TypeError):
+            except (orjson.JSONDecodeError, TypeError):
                 continue
         parts.append("")
 
     # Exhaustion
-    exh_key = REDIS_KEY_SCORES_EXHAUSTION.format(exchange=exchange, symbol=symbol)
-    exh_items = await r.lrange(exh_key, -min(SCORES_MAXLEN, 10), -1)
     if exh_items:
         parts.append("=== EXHAUSTION / ABSORPTION ===")
         for raw in exh_items[-5:]:
             try:
-                s = json.loads(raw)
+                s = orjson.loads(raw)
                 parts.append(
                     f"  {_ts_to_str(s.get('ts'))} exhaustion={s.get('exhaustion_score', 0):.3f} absorption={s.get('absorption_score', 0):.3f}"
                 )
-            except (json.JSONDecodeError, TypeError):
+            except (orjson.JSONDecodeError, TypeError):
                 continue
         parts.append("")
 
     # Mamba tick signal (prob_up, prob_down, delta_score)
-    mamba_key = REDIS_KEY_MAMBA_SIGNAL.format(exchange=exchange, symbol=symbol)
-    mamba_raw = await r.get(mamba_key)
     if mamba_raw:
         try:
-            mamba = json.loads(mamba_raw)
+            mamba = orjson.loads(mamba_raw)
             parts.append("=== MAMBA SIGNAL ===")
             parts.append(
                 f"  prob_up={mamba.get('prob_up', 0):.2f} prob_down={mamba.get('prob_down', 0):.2f} delta_score={mamba.get('delta_score', 0):.2f} ts={_ts_to_str(mamba.get('ts'))}"
             )
             parts.append("")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             pass
 
     # Rule reversal signals
-    sig_key = REDIS_KEY_SIGNALS_RULE.format(exchange=exchange, symbol=symbol)
-    sig_items = await r.lrange(sig_key, -min(SIGNALS_MAXLEN, 5), -1)
     if sig_items:
         parts.append("=== REVERSAL SIGNALS ===")
         for raw in sig_items[-3:]:
             try:
-                s = json.loads(raw)
+                s = orjson.loads(raw)
                 rng = s.get("expected_move_range", [])
                 parts.append(
                     f"  {_ts_to_str(s.get('ts'))} prob_reversal={s.get('prob_reversal_rule', 0):.2f} horizon_bars={s.get('reversal_horizon_bars')} range={rng}"
                 )
-            except (json.JSONDecodeError, TypeError):
+            except (orjson.JSONDecodeError, TypeError):
                 continue
         parts.append("")
 
@@ -193,7 +269,7 @@ async def build_market_context(r: redis.Redis, exchange: str, symbol: str) -> st
 
 async def get_or_build_context(r: redis.Redis, exchange: str, symbol: str) -> str:
     """Return cached context if present and not expired, else build and cache."""
-    key = REDIS_KEY_AI_CONTEXT.format(exchange=exchange, symbol=symbol)
+    key = _context_key(exchange, symbol)
     cached = await r.get(key)
     if cached:
         return cached
@@ -206,16 +282,38 @@ async def run_worker(redis_url: str, refresh_interval_sec: float = 10.0):
     """Background worker: refresh context for pairs that have recent snapshot/activity.
     Expects Redis set 'ai:active_pairs' with members 'exchange:symbol' (populated by API on snapshot).
     """
-    r = redis.from_url(redis_url, decode_responses=True)
+    r = redis.from_url(redis_url, decode_responses=True, max_connections=2 * WORKER_CONCURRENCY)
+    sem = asyncio.Semaphore(WORKER_CONCURRENCY)
+    # (exchange, symbol) -> (отпечаток сырых ответов Redis, monotonic время последнего изменения)
+    last_built: dict = {}
+
+    async def refresh(member: str, exchange: str, symbol: str) -> None:
+        async with sem:
+            pair = (exchange, symbol)
+            key = _context_key(exchange, symbol)
+            results = await _fetch(r, exchange, symbol)
+            fingerprint = hash(tuple(tuple(x) if isinstance(x, list) else x for x in results))
+            now = time.monotonic()
+            prev = last_built.get(pair)
+            if prev is not None and prev[0] == fingerprint:
+                if now - prev[1] > STALE_PAIR_SEC:
+                    await r.srem("ai:active_pairs", member)
+                    last_built.pop(pair, None)
+                    return
+                # Данные не менялись: только продлеваем TTL готового текста (если он еще есть)
+                if await r.expire(key, AI_CONTEXT_TTL_SEC):
+                    return
+            ctx = await asyncio.to_thread(_build_text, results)
+            await r.set(key, ctx, ex=AI_CONTEXT_TTL_SEC)
+            if prev is None or prev[0] != fingerprint:
+                last_built[pair] = (fingerprint, now)
+
     while True:
         try:
             pairs_raw = await r.smembers("ai:active_pairs")
-            for member in pairs_raw or []:
-                if ":" in member:
-                    exchange, symbol = member.split(":", 1)
-                    ctx = await build_market_context(r, exchange, symbol)
-                    key = REDIS_KEY_AI_CONTEXT.format(exchange=exchange, symbol=symbol)
-                    await r.set(key, ctx, ex=AI_CONTEXT_TTL_SEC)
+            pairs = [(member, *member.split(":", 1)) for member in pairs_raw or [] if ":" in member]
+            # Round-trip'ы разных пар перекрываются: время обновления ~RTT, а не N * RTT
+            await asyncio.gather(*(refresh(member, exchange, symbol) for member, exchange, symbol in pairs))
             await asyncio.sleep(refresh_interval_sec)
         except asyncio.CancelledError:
             break
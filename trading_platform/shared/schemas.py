@@ -1,6 +1,11 @@
 """
 Normalized message schemas for the platform (all exchanges -> same format).
+
+Events are slotted dataclasses (no per-event dict); orjson serializes them natively
+into the same JSON objects, optional fields that are not set become null.
 """
+from dataclasses import dataclass
+
 # orderbook_event: exchange, symbol, type (snapshot|delta), ts, bids [[price, size]], asks [[price, size]], update_id?
 # trade: exchange, symbol, side, price, size, ts, trade_id
 # candle: exchange, symbol, interval, start, open, high, low, close, volume, confirm
@@ -40,43 +45,104 @@ OPEN_INTEREST_VALUE_FIELD = "open_interest_value"
 QUANTITY_FIELD = "quantity"
 
 
-def orderbook_event(exchange: str, symbol: str, event_type: str, ts: int, bids: list, asks: list, update_id=None) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        TYPE_FIELD: event_type,
-        TS_FIELD: ts,
-        BIDS_FIELD: bids,
-        ASKS_FIELD: asks,
-        **({} if update_id is None else {UPDATE_ID_FIELD: update_id}),
-    }
-
-
-def trade_event(exchange: str, symbol: str, side: str, price: float, size: float, ts: int, trade_id=None) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        SIDE_FIELD: side,
-        PRICE_FIELD: price,
-        SIZE_FIELD: size,
-        TS_FIELD: ts,
-        **({} if trade_id is None else {TRADE_ID_FIELD: trade_id}),
-    }
-
-
-def candle_event(exchange: str, symbol: str, interval: str, start: int, o: float, h: float, lo: float, c: float, vol: float, confirm: bool) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        INTERVAL_FIELD: interval,
-        START_FIELD: start,
-        OPEN_FIELD: o,
-        HIGH_FIELD: h,
-        LOW_FIELD: lo,
-        CLOSE_FIELD: c,
-        VOLUME_FIELD: vol,
-        CONFIRM_FIELD: confirm,
-    }
+@dataclass(slots=True)
+class OrderbookEvent:
+    exchange: str
+    symbol: str
+    type: str
+    ts: int
+    bids: list
+    asks: list
+    update_id: object = None
+
+
+@dataclass(slots=True)
+class TradeEvent:
+    exchange: str
+    symbol: str
+    side: str
+    price: float
+    size: float
+    ts: int
+    trade_id: object = None
+
+
+@dataclass(slots=True)
+class CandleEvent:
+    exchange: str
+    symbol: str
+    interval: str
+    start: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    confirm: bool
+
+
+@dataclass(slots=True)
+class TrendScoreEvent:
+    exchange: str
+    symbol: str
+    ts: int
+    score_candle: float
+    score_volume: float
+    score_orderbook: float
+    score_impulse: float
+    trend_power: float
+    trend_power_delta: float
+
+
+@dataclass(slots=True)
+class ExhaustionEvent:
+    exchange: str
+    symbol: str
+    ts: int
+    exhaustion_score: float
+    absorption_score: float
+
+
+@dataclass(slots=True)
+class RuleReversalEvent:
+    exchange: str
+    symbol: str
+    ts: int
+    prob_reversal_rule: float
+    reversal_horizon_bars: int
+    expected_move_range: list
+
+
+@dataclass(slots=True)
+class OpenInterestEvent:
+    exchange: str
+    symbol: str
+    ts: int
+    open_interest: float
+    open_interest_value: float | None = None
+
+
+@dataclass(slots=True)
+class LiquidationEvent:
+    """Side: Buy = liquidation of Long, Sell = liquidation of Short."""
+    exchange: str
+    symbol: str
+    ts: int
+    price: float
+    quantity: float
+    side: str
+
+
+def orderbook_event(exchange: str, symbol: str, event_type: str, ts: int, bids: list, asks: list, update_id=None) -> OrderbookEvent:
+    return OrderbookEvent(exchange, symbol, event_type, ts, bids, asks, update_id)
+
+
+def trade_event(exchange: str, symbol: str, side: str, price: float, size: float, ts: int, trade_id=None) -> TradeEvent:
+    return TradeEvent(exchange, symbol, side, price, size, ts, trade_id)
+
+
+def candle_event(exchange: str, symbol: str, interval: str, start: int, o: float, h: float, lo: float, c: float, vol: float, confirm: bool) -> CandleEvent:
+    return CandleEvent(exchange, symbol, interval, start, o, h, lo, c, vol, confirm)
 
 
 def trend_score_event(
@@ -89,28 +155,22 @@ def trend_score_event(
     score_impulse: float,
     trend_power: float,
     trend_power_delta: float,
-) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        TS_FIELD: ts,
-        SCORE_CANDLE_FIELD: score_candle,
-        SCORE_VOLUME_FIELD: score_volume,
-        SCORE_ORDERBOOK_FIELD: score_orderbook,
-        SCORE_IMPULSE_FIELD: score_impulse,
-        TREND_POWER_FIELD: trend_power,
-        TREND_POWER_DELTA_FIELD: trend_power_delta,
-    }
-
-
-def exhaustion_event(exchange: str, symbol: str, ts: int, exhaustion_score: float, absorption_score: float) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        TS_FIELD: ts,
-        EXHAUSTION_SCORE_FIELD: exhaustion_score,
-        ABSORPTION_SCORE_FIELD: absorption_score,
-    }
+) -> TrendScoreEvent:
+    return TrendScoreEvent(
+        exchange,
+        symbol,
+        ts,
+        score_candle,
+        score_volume,
+        score_orderbook,
+        score_impulse,
+        trend_power,
+        trend_power_delta,
+    )
+
+
+def exhaustion_event(exchange: str, symbol: str, ts: int, exhaustion_score: float, absorption_score: float) -> ExhaustionEvent:
+    return ExhaustionEvent(exchange, symbol, ts, exhaustion_score, absorption_score)
 
 
 def rule_reversal_event(
@@ -120,15 +180,8 @@ def rule_reversal_event(
     prob_reversal_rule: float,
     reversal_horizon_bars: int,
     expected_move_range: list,
-) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        TS_FIELD: ts,
-        PROB_REVERSAL_FIELD: prob_reversal_rule,
-        REVERSAL_HORIZON_FIELD: reversal_horizon_bars,
-        EXPECTED_RANGE_FIELD: expected_move_range,
-    }
+) -> RuleReversalEvent:
+    return RuleReversalEvent(exchange, symbol, ts, prob_reversal_rule, reversal_horizon_bars, expected_move_range)
 
 
 def open_interest_event(
@@ -137,14 +190,8 @@ def open_interest_event(
     ts: int,
     open_interest: float,
     open_interest_value: float | None = None,
-) -> dict:
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        TS_FIELD: ts,
-        OPEN_INTEREST_FIELD: open_interest,
-        **({} if open_interest_value is None else {OPEN_INTEREST_VALUE_FIELD: open_interest_value}),
-    }
+) -> OpenInterestEvent:
+    return OpenInterestEvent(exchange, symbol, ts, open_interest, open_interest_value)
 
 
 def liquidation_event(
@@ -154,13 +201,6 @@ def liquidation_event(
     price: float,
     quantity: float,
     side: str,
-) -> dict:
+) -> LiquidationEvent:
     """Side: Buy = liquidation of Long, Sell = liquidation of Short."""
-    return {
-        EXCHANGE_FIELD: exchange,
-        SYMBOL_FIELD: symbol,
-        TS_FIELD: ts,
-        PRICE_FIELD: price,
-        QUANTITY_FIELD: quantity,
-        SIDE_FIELD: side,
-    }
+    return LiquidationEvent(exchange, symbol, ts, price, quantity, side)
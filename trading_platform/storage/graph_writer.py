@@ -1,23 +1,25 @@
 """
-Graph writer worker: reads from Redis Streams (events, liquidations, open_interest),
-writes Event and MarketState nodes to Neo4j. Periodically samples PriceLevel and Trade from DOM/trades.
+Graph writer worker: reads from Redis Streams (trades, events, liquidations, open_interest),
+writes Event and MarketState nodes to Neo4j. Periodically samples PriceLevel from DOM and the last Trade.
 """
 import asyncio
-import json
 import argparse
+import functools
+import itertools
 import os
 import sys
 import time
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import orjson
 import redis.asyncio as redis
 
 from shared.streams import (
+    STREAM_TRADES,
     STREAM_EVENTS,
     STREAM_LIQUIDATIONS,
     STREAM_OPEN_INTEREST,
-    REDIS_KEY_TRADES,
     REDIS_KEY_DOM,
 )
 
@@ -25,18 +27,26 @@ SAMPLE_INTERVAL = float(os.environ.get("GRAPH_SAMPLE_INTERVAL_SEC", "45"))
 TRADE_MIN_SIZE = float(os.environ.get("GRAPH_TRADE_MIN_SIZE", "0.01"))
 PRICE_LEVEL_TOP_N = int(os.environ.get("GRAPH_PRICE_LEVEL_TOP_N", "5"))
 GRAPH_SAMPLE_PAIRS = os.environ.get("GRAPH_SAMPLE_PAIRS", "bybit:BTCUSDT")
+GRAPH_FLUSH_INTERVAL_SEC = float(os.environ.get("GRAPH_FLUSH_INTERVAL_SEC", "1.0"))
+GRAPH_FLUSH_MAX_ROWS = int(os.environ.get("GRAPH_FLUSH_MAX_ROWS", "500"))
+GRAPH_GROUP = os.environ.get("GRAPH_CONSUMER_GROUP", "graph-writers")
+CLAIM_IDLE_MS = int(os.environ.get("GRAPH_CLAIM_IDLE_MS", "60000"))  # pending longer than this: instance is gone
 
 
-async def get_last_price(r: redis.Redis, exchange: str, symbol: str) -> float | None:
-    """Read last trade price from Redis list."""
-    key = REDIS_KEY_TRADES.format(exchange=exchange, symbol=symbol)
-    items = await r.lrange(key, -1, -1)
-    if not items:
+@functools.lru_cache(maxsize=4096)
+def _dom_key(exchange: str, symbol: str) -> str:
+    """Cached REDIS_KEY_DOM key (str.format with kwargs on every sample is not free)."""
+    return REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)
+
+
+def get_last_price(last_trade: dict[tuple[str, str], dict], exchange: str, symbol: str) -> float | None:
+    """Last trade price from the in-memory map fed by STREAM_TRADES."""
+    t = last_trade.get((exchange, symbol))
+    if not t:
         return None
     try:
-        t = json.loads(items[0])
         return float(t.get("price", 0)) if t.get("price") else None
-    except (json.JSONDecodeError, TypeError, KeyError):
+    except (TypeError, ValueError):
         return None
 
 
@@ -45,143 +55,309 @@ def _parse_dom_bids_asks(raw: str | None):
     if not raw:
         return [], [], 0
     try:
-        data = json.loads(raw)
+        data = orjson.loads(raw)
         ts = int(data.get("ts", 0))
         bids = data.get("bids") or []
         asks = data.get("asks") or []
         return bids, asks, ts
-    except (json.JSONDecodeError, TypeError, KeyError):
+    except (orjson.JSONDecodeError, TypeError, KeyError):
         return [], [], 0
 
 
-async def _sample_price_levels_and_trades(r: redis.Redis, pairs: list[tuple[str, str]]) -> None:
-    """For each (exchange, symbol) write top PriceLevels from DOM and last large Trade to Neo4j."""
-    try:
-        from services.graph.writer import write_price_level, write_trade
-    except ImportError:
-        return
+def _sample_price_levels_and_trades(
+    dom_raw: list[str | None],
+    pairs: list[tuple[str, str, str]],
+    last_trade: dict[tuple[str, str], dict],
+    pending: dict[str, list[dict]],
+) -> None:
+    """For each (exchange, symbol, dom_key) queue top PriceLevels from DOM and last large Trade."""
     now_ts = int(time.time() * 1000)
-    for exchange, symbol in pairs:
+    for (exchange, symbol, _), raw in zip(pairs, dom_raw):
         try:
-            dom_key = REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)
-            raw = await r.get(dom_key)
             bids, asks, ts = _parse_dom_bids_asks(raw)
             ts = ts or now_ts
-            for i, entry in enumerate(bids[:PRICE_LEVEL_TOP_N]):
+            for entry in bids[:PRICE_LEVEL_TOP_N]:
                 if isinstance(entry, (list, tuple)) and len(entry) >= 2:
-                    price = float(entry[0])
-                    vol = float(entry[1])
-                    write_price_level(exchange, symbol, price, ts, vol_bid=vol, vol_ask=0.0)
-            for i, entry in enumerate(asks[:PRICE_LEVEL_TOP_N]):
+                    pending["price_levels"].append({
+                        "exchange": exchange, "symbol": symbol, "price": float(entry[0]), "ts": ts,
+                        "vol_bid": float(entry[1]), "vol_ask": 0.0,
+                    })
+            for entry in asks[:PRICE_LEVEL_TOP_N]:
                 if isinstance(entry, (list, tuple)) and len(entry) >= 2:
-                    price = float(entry[0])
-                    vol = float(entry[1])
-                    write_price_level(exchange, symbol, price, ts, vol_bid=0.0, vol_ask=vol)
+                    pending["price_levels"].append({
+                        "exchange": exchange, "symbol": symbol, "price": float(entry[0]), "ts": ts,
+                        "vol_bid": 0.0, "vol_ask": float(entry[1]),
+                    })
 
-            trades_key = REDIS_KEY_TRADES.format(exchange=exchange, symbol=symbol)
-            items = await r.lrange(trades_key, -1, -1)
-            if items:
+            t = last_trade.get((exchange, symbol))
+            if t:
                 try:
-                    t = json.loads(items[0])
                     size = float(t.get("size", t.get("volume", 0)))
                     if size >= TRADE_MIN_SIZE:
                         price = float(t.get("price", 0))
                         side = str(t.get("side", ""))
                         ts_t = int(t.get("ts", 0))
-                        trade_id = f"{exchange}:{symbol}:{ts_t}:{price}:{size}:{side}"
-                        write_trade(exchange, symbol, trade_id, ts_t, price, size, side)
-                except (json.JSONDecodeError, TypeError, KeyError):
+                        pending["trades"].append({
+                            "id": f"{exchange}:{symbol}:{ts_t}:{price}:{size}:{side}",
+                            "exchange": exchange, "symbol": symbol, "ts": ts_t,
+                            "price": price, "size": size, "side": side,
+                        })
+                except (TypeError, ValueError):
                     pass
         except Exception as e:
             print(f"[graph_writer] sample error for {exchange}/{symbol}: {e}")
 
 
+def _hide_later_states(events: list[dict], states: list[dict]) -> None:
+    """Add to each event's "hidden" the ids of same-pair MarketStates queued after it.
+
+    Per event the old code wrote the Event, then its MarketState: an Event never linked to a state
+    that arrived after it. States are now written first, so those ids are excluded in the link query.
+    """
+    by_pair: dict[tuple[str, str], list[dict]] = {}
+    for state in states:
+        by_pair.setdefault((state["exchange"], state["symbol"]), []).append(state)
+    for event in events:
+        earlier, later = set(), set()
+        for state in by_pair.get((event["exchange"], event["symbol"]), ()):
+            state_id = f"{state['exchange']}:{state['symbol']}:{state['ts']}"
+            if state["seq"] < event["seq"]:
+                earlier.add(state_id)
+            elif state["ts"] <= event["ts"]:
+                later.add(state_id)
+        # Same ts -> same node id (MERGE): a state queued earlier keeps it linkable
+        later -= earlier
+        if later:
+            event.setdefault("hidden", []).extend(later)
+
+
+def _flush_pending(pending: dict[str, list[dict]]) -> None:
+    """Write all queued rows with one UNWIND query per node type, clearing each written queue.
+
+    Raises the first write error after trying every type; failed queues are kept.
+
+    MarketStates go first, then Events: an Event links to the latest MarketState queued before it
+    (by "seq") or already in the graph, as with the per-event write order. Events wait while
+    the MarketState write fails.
+    """
+    from services.graph.writer import (
+        write_events_batch,
+        write_market_states_batch,
+        write_price_levels_batch,
+        write_trades_batch,
+    )
+
+    error = None
+    states_ok = True
+    for kind, write_batch in (
+        ("market_states", write_market_states_batch),
+        ("events", write_events_batch),
+        ("price_levels", write_price_levels_batch),
+        ("trades", write_trades_batch),
+    ):
+        rows = pending[kind]
+        if not rows or (kind == "events" and not states_ok):
+            continue
+        try:
+            # False: Neo4j not configured, nothing will ever write these rows; drop them
+            write_batch(rows)
+        except Exception as e:
+            # Failed write: rows stay queued and are retried on the next flush
+            error = error or e
+            states_ok = kind != "market_states"
+            continue
+        if kind == "market_states":
+            # Only once the states are in the graph: on a retry they are not counted twice
+            _hide_later_states(pending["events"], rows)
+        pending[kind] = []
+    if error is not None:
+        raise error
+
+
 async def run_graph_writer(redis_url: str):
     r = redis.from_url(redis_url, decode_responses=True)
-    last_ids = {
-        STREAM_EVENTS: "$",
-        STREAM_LIQUIDATIONS: "$",
-        STREAM_OPEN_INTEREST: "$",
-    }
+    streams = [STREAM_TRADES, STREAM_EVENTS, STREAM_LIQUIDATIONS, STREAM_OPEN_INTEREST]
+    # Consumer group instead of "$": a restart resumes after the last delivered entry.
+    # last_trade/last_oi are per instance, so several instances only make sense per disjoint set of pairs.
+    consumer = f"{GRAPH_GROUP}:{os.getpid()}"
+    read_ids = {stream: ">" for stream in streams}
+    # stream -> ids read since the last Neo4j flush; XACK goes out right after that flush
+    ack_ids: dict[str, list] = {stream: [] for stream in streams}
     # (exchange, symbol) -> (ts, oi) for MarketState
     last_oi: dict[tuple[str, str], tuple[int, float]] = {}
+    # (exchange, symbol) -> last trade payload: price for MarketState and Trade sampling
+    # without an lrange + json parse per event
+    last_trade: dict[tuple[str, str], dict] = {}
+    # Neo4j rows queued per node type; flushed as UNWIND batches (one Bolt round-trip per type)
+    pending: dict[str, list[dict]] = {"events": [], "market_states": [], "price_levels": [], "trades": []}
+    # Arrival order of Events and MarketStates across their queues (see _flush_pending)
+    seq = itertools.count()
     market_state_interval = 5.0
     last_market_state_flush = 0.0
     last_sample_time = 0.0
-    sample_pairs: list[tuple[str, str]] = []
+    last_flush = last_claim = time.time()
+    # (exchange, symbol, dom_key): keys are built once, not on every sample
+    sample_pairs: list[tuple[str, str, str]] = []
     for part in GRAPH_SAMPLE_PAIRS.strip().split(","):
         part = part.strip()
         if ":" in part:
             ex, sym = part.split(":", 1)
-            sample_pairs.append((ex.strip(), sym.strip()))
+            ex, sym = ex.strip(), sym.strip()
+            sample_pairs.append((ex, sym, _dom_key(ex, sym)))
+
+    def handle(stream_name: str, msg_id: str, fields: dict | None) -> None:
+        ack_ids[stream_name].append(msg_id)
+        payload_str = (fields or {}).get("payload")
+        if not payload_str:
+            return
+        try:
+            payload = orjson.loads(payload_str)
+        except orjson.JSONDecodeError:
+            return
+        exchange = payload.get("exchange", "")
+        symbol = payload.get("symbol", "")
+        if not exchange or not symbol:
+            return
+
+        if stream_name == STREAM_TRADES:
+            last_trade[(exchange, symbol)] = payload
+
+        elif stream_name == STREAM_EVENTS:
+            event_type = payload.get("type", "event")
+            ts = int(payload.get("ts_start") or payload.get("ts") or 0)
+            pending["events"].append({
+                "seq": next(seq), "exchange": exchange, "symbol": symbol,
+                "type": event_type, "ts": ts, "payload": payload,
+            })
+            price = get_last_price(last_trade, exchange, symbol)
+            oi_data = last_oi.get((exchange, symbol))
+            oi = oi_data[1] if oi_data else None
+            pending["market_states"].append({
+                "seq": next(seq), "exchange": exchange, "symbol": symbol, "ts": ts, "price": price or 0.0, "oi": oi,
+            })
+
+        elif stream_name == STREAM_LIQUIDATIONS:
+            ts = int(payload.get("ts", 0))
+            liq_payload = {
+                "price": payload.get("price"),
+                "quantity": payload.get("quantity"),
+                "side": payload.get("side"),
+            }
+            pending["events"].append({
+                "seq": next(seq), "exchange": exchange, "symbol": symbol,
+                "type": "liquidation", "ts": ts, "payload": liq_payload,
+            })
+            price = float(payload.get("price", 0)) or get_last_price(last_trade, exchange, symbol)
+            oi_data = last_oi.get((exchange, symbol))
+            oi = oi_data[1] if oi_data else None
+            pending["market_states"].append({
+                "seq": next(seq), "exchange": exchange, "symbol": symbol, "ts": ts, "price": price or 0.0, "oi": oi,
+            })
+
+        elif stream_name == STREAM_OPEN_INTEREST:
+            ts = int(payload.get("ts", 0))
+            oi = float(payload.get("open_interest", 0) or 0)
+            last_oi[(exchange, symbol)] = (ts, oi)
+
+    async def ensure_groups() -> None:
+        """Create the consumer group on every stream (BUSYGROUP: it already exists)."""
+        for stream in streams:
+            try:
+                await r.xgroup_create(stream, GRAPH_GROUP, id="$", mkstream=True)
+            except redis.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def claim_stale() -> None:
+        """Take over entries delivered to a crashed/restarted instance and never acked (XAUTOCLAIM).
 
-    from services.graph.writer import write_event, write_market_state
+        Runs at startup and every CLAIM_IDLE_MS: the consumer name carries the pid, so after a
+        restart the old consumer's entries only become idle enough once the new instance is running.
+        """
+        for stream in streams:
+            start_id = "0-0"
+            # XAUTOCLAIM also returns our own unacked entries (rows already queued): skip them
+            held = set(ack_ids[stream])
+            while True:
+                reply = await r.xautoclaim(stream, GRAPH_GROUP, consumer, CLAIM_IDLE_MS, start_id=start_id, count=1000)
+                start_id, messages = reply[0], reply[1]
+                for msg_id, fields in messages:
+                    if msg_id in held:
+                        continue
+                    # Redis 6.2 returns entries already trimmed from the stream (MAXLEN) as nil
+                    if msg_id is not None:
+                        handle(stream, msg_id, fields)
+                if start_id == "0-0":
+                    break
+
+    async def flush() -> None:
+        # Neo4j driver is synchronous: the flush runs in a thread so the event loop is not blocked.
+        # On a write error this raises before XACK: the ids stay pending with their rows.
+        await asyncio.to_thread(_flush_pending, pending)
+        pipe = r.pipeline(transaction=False)
+        for stream, ids in ack_ids.items():
+            if ids:
+                pipe.xack(stream, GRAPH_GROUP, *ids)
+                ack_ids[stream] = []
+        await pipe.execute()
 
     while True:
         try:
-            streams = [[name, last_ids[name]] for name in last_ids]
-            result = await r.xread(streams=dict(streams), count=100, block=2000)
+            await ensure_groups()
+            await claim_stale()
+            break
+        except redis.RedisError as e:
+            print(f"[graph_writer] Consumer group setup failed: {e}, retry in 5s")
+            await asyncio.sleep(5)
+
+    while True:
+        try:
+            # count is per stream: trades arrive orders of magnitude faster than events
+            result = await r.xreadgroup(GRAPH_GROUP, consumer, read_ids, count=1000, block=2000)
             if result:
                 for stream_name, messages in result:
                     for msg_id, fields in messages:
-                        last_ids[stream_name] = msg_id
-                        payload_str = (fields or {}).get("payload")
-                        if not payload_str:
-                            continue
-                        try:
-                            payload = json.loads(payload_str)
-                        except json.JSONDecodeError:
-                            continue
-                        exchange = payload.get("exchange", "")
-                        symbol = payload.get("symbol", "")
-                        if not exchange or not symbol:
-                            continue
-
-                        if stream_name == STREAM_EVENTS:
-                            event_type = payload.get("type", "event")
-                            ts = int(payload.get("ts_start") or payload.get("ts") or 0)
-                            write_event(exchange, symbol, event_type, ts, payload)
-                            price = await get_last_price(r, exchange, symbol)
-                            oi_data = last_oi.get((exchange, symbol))
-                            oi = oi_data[1] if oi_data else None
-                            write_market_state(exchange, symbol, ts, price or 0.0, oi)
-
-                        elif stream_name == STREAM_LIQUIDATIONS:
-                            ts = int(payload.get("ts", 0))
-                            liq_payload = {
-                                "price": payload.get("price"),
-                                "quantity": payload.get("quantity"),
-                                "side": payload.get("side"),
-                            }
-                            write_event(exchange, symbol, "liquidation", ts, liq_payload)
-                            price = float(payload.get("price", 0)) or (await get_last_price(r, exchange, symbol))
-                            oi_data = last_oi.get((exchange, symbol))
-                            oi = oi_data[1] if oi_data else None
-                            write_market_state(exchange, symbol, ts, price or 0.0, oi)
-
-                        elif stream_name == STREAM_OPEN_INTEREST:
-                            ts = int(payload.get("ts", 0))
-                            oi = float(payload.get("open_interest", 0) or 0)
-                            last_oi[(exchange, symbol)] = (ts, oi)
+                        handle(stream_name, msg_id, fields)
 
             # Periodic MarketState flush for pairs we have OI for (price from trades)
             now = time.time()
             if now - last_market_state_flush >= market_state_interval and last_oi:
                 for (exchange, symbol), (ts, oi) in list(last_oi.items()):
-                    price = await get_last_price(r, exchange, symbol)
+                    price = get_last_price(last_trade, exchange, symbol)
                     if price is not None:
-                        write_market_state(exchange, symbol, ts, price, oi)
+                        pending["market_states"].append({
+                            "seq": next(seq), "exchange": exchange, "symbol": symbol,
+                            "ts": ts, "price": price, "oi": oi,
+                        })
                 last_market_state_flush = now
 
             # Periodic PriceLevel and Trade sampling for configured pairs
             if sample_pairs and now - last_sample_time >= SAMPLE_INTERVAL:
-                await _sample_price_levels_and_trades(r, sample_pairs)
+                dom_raw = await r.mget([dom_key for _, _, dom_key in sample_pairs])
+                _sample_price_levels_and_trades(dom_raw, sample_pairs, last_trade, pending)
                 last_sample_time = now
 
+            if now - last_flush >= GRAPH_FLUSH_INTERVAL_SEC or any(
+                len(rows) >= GRAPH_FLUSH_MAX_ROWS for rows in pending.values()
+            ):
+                await flush()
+                last_flush = now
+
+            if now - last_claim >= CLAIM_IDLE_MS / 1000:
+                await claim_stale()
+                last_claim = now
+
         except asyncio.CancelledError:
+            try:
+                await flush()
+            except Exception as e:
+                print(f"[graph_writer] Final flush failed, entries stay pending: {e}")
             break
         except Exception as e:
             print(f"[graph_writer] Error: {e}")
+            # Stream deleted/recreated: the groups have to be created again
+            if isinstance(e, redis.ResponseError) and "NOGROUP" in str(e):
+                await ensure_groups()
             await asyncio.sleep(2)
 
 
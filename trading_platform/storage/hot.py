@@ -3,15 +3,25 @@ Hot storage: reads from Redis Streams (orderbook_updates, trades), maintains in-
 orderbook per instrument, writes DOM + ring buffers (slices, trades) to Redis.
 """
 import asyncio
-import json
 import argparse
+import heapq
+import operator
 import sys
 import os
+from collections import defaultdict
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+import orjson
 import redis.asyncio as redis
 
+try:
+    from sortedcontainers import SortedDict
+    SORTEDCONTAINERS_AVAILABLE = True
+except ImportError:
+    SortedDict = None
+    SORTEDCONTAINERS_AVAILABLE = False
+
 from shared.schemas import EXCHANGE_FIELD, SYMBOL_FIELD, TYPE_FIELD, TS_FIELD, BIDS_FIELD, ASKS_FIELD
 from shared.streams import (
     STREAM_ORDERBOOK_UPDATES,
@@ -23,98 +33,184 @@ from shared.streams import (
     TRADES_MAXLEN,
 )
 
+# Клиент без decode_responses: имена стримов и поля приходят bytes, без utf-8 decode на каждое сообщение
+_ORDERBOOK_STREAM = STREAM_ORDERBOOK_UPDATES.encode()
+_TRADES_STREAM = STREAM_TRADES.encode()
+
+# Максимальная частота публикации DOM/slices на инструмент при потоке delta (по умолчанию 50 Гц)
+DOM_PUBLISH_INTERVAL_SEC = float(os.environ.get("HOT_DOM_PUBLISH_INTERVAL_SEC", "0.02"))
+
+
+def _new_book() -> tuple[dict, dict]:
+    """Пустые (bids, asks): с sortedcontainers — уровни всегда упорядочены от лучшей цены."""
+    if SORTEDCONTAINERS_AVAILABLE:
+        return SortedDict(operator.neg), SortedDict()
+    return {}, {}
+
 
 def _apply_snapshot(bids: dict, asks: dict, payload: dict) -> None:
+    # Цены/объёмы уже float: ингесторы приводят их в _parse_bids_asks, orjson отдаёт числа как float.
+    # Книга строится одним update (SortedDict сортирует ключи один раз), без поуровневых вставок.
     bids.clear()
     asks.clear()
-    for entry in payload.get(BIDS_FIELD, []):
-        if len(entry) >= 2:
-            p, s = float(entry[0]), float(entry[1])
-            if s > 0:
-                bids[p] = s
-    for entry in payload.get(ASKS_FIELD, []):
-        if len(entry) >= 2:
-            p, s = float(entry[0]), float(entry[1])
-            if s > 0:
-                asks[p] = s
+    bids.update([(e[0], e[1]) for e in payload.get(BIDS_FIELD, []) if len(e) >= 2 and e[1] > 0])
+    asks.update([(e[0], e[1]) for e in payload.get(ASKS_FIELD, []) if len(e) >= 2 and e[1] > 0])
 
 
 def _apply_delta(bids: dict, asks: dict, payload: dict) -> None:
     for entry in payload.get(BIDS_FIELD, []):
         if len(entry) >= 2:
-            p, s = float(entry[0]), float(entry[1])
+            p, s = entry[0], entry[1]
             if s <= 0:
                 bids.pop(p, None)
             else:
                 bids[p] = s
     for entry in payload.get(ASKS_FIELD, []):
         if len(entry) >= 2:
-            p, s = float(entry[0]), float(entry[1])
+            p, s = entry[0], entry[1]
             if s <= 0:
                 asks.pop(p, None)
             else:
                 asks[p] = s
 
 
+_PRICE = operator.itemgetter(0)
+
+
+def _top_levels(side: dict, limit: int, select, reverse: bool) -> list:
+    # Глубокая книга: выбор top-N по ключам за O(N log limit) вместо полной сортировки;
+    # до ~10*limit уровней sorted быстрее (меньше работы на уровне интерпретатора)
+    if len(side) > 10 * limit:
+        return [[p, side[p]] for p in select(limit, side)]
+    return [[p, s] for p, s in sorted(side.items(), key=_PRICE, reverse=reverse)[:limit]]
+
+
 def _to_lists(bids: dict, asks: dict, limit: int = 200):
-    b = sorted(bids.items(), key=lambda x: -x[0])[:limit]
-    a = sorted(asks.items(), key=lambda x: x[0])[:limit]
-    return [[p, s] for p, s in b], [[p, s] for p, s in a]
+    if SortedDict is not None and isinstance(bids, SortedDict):
+        # Книга уже упорядочена: O(limit) срез вместо сортировки всех уровней на каждый delta
+        return (
+            [[p, bids[p]] for p in bids.islice(0, limit)],
+            [[p, asks[p]] for p in asks.islice(0, limit)],
+        )
+    return _top_levels(bids, limit, heapq.nlargest, True), _top_levels(asks, limit, heapq.nsmallest, False)
+
+
+def _dom_json(bids: dict, asks: dict, ts) -> tuple[bytes, tuple[list, list]]:
+    """JSON для DOM/slices и сами top-N уровни (для сравнения с прошлым slice)."""
+    b_list, a_list = _to_lists(bids, asks)
+    # DOM и элемент slices — один и тот же JSON, сериализуем один раз
+    return orjson.dumps({"ts": ts, "bids": b_list, "asks": a_list}), (b_list, a_list)
 
 
 async def run_hot_storage(redis_url: str):
-    r = redis.from_url(redis_url, decode_responses=True)
-    # in-memory orderbooks: (exchange, symbol) -> (bids dict, asks dict)
+    r = redis.from_url(redis_url)
+    # in-memory orderbooks: (exchange, symbol) -> (bids, asks), см. _new_book
     orderbooks: dict[tuple[str, str], tuple[dict, dict]] = {}
-    last_ids = {STREAM_ORDERBOOK_UPDATES: "$", STREAM_TRADES: "$"}
+    last_ids = {_ORDERBOOK_STREAM: "$", _TRADES_STREAM: "$"}
+    # Книги, изменённые delta после последней публикации: (exchange, symbol) -> ts последнего delta.
+    # Публикует их _publish_dirty не чаще DOM_PUBLISH_INTERVAL_SEC: N delta между тиками — один SET/RPUSH
+    dirty: dict[tuple[str, str], int] = {}
+    # top-N уровни последнего slice по инструменту: изменения глубже top-N не порождают новый slice
+    # (DOM при этом обновляется — в нём свежий ts). Сравнение списков точнее и дешевле хэша JSON с ts
+    last_top: dict[tuple[str, str], tuple[list, list]] = {}
+    # Пишущие pipeline основного цикла и публикатора по очереди — slices не перемешиваются
+    write_lock = asyncio.Lock()
+
+    async def _publish_dirty() -> None:
+        while True:
+            await asyncio.sleep(DOM_PUBLISH_INTERVAL_SEC)
+            if not dirty:
+                continue
+            items = []
+            try:
+                async with write_lock:
+                    # Снимок ключей: delta, пришедшие во время execute, пометят ключ заново
+                    items = list(dirty.items())
+                    dirty.clear()
+                    new_top = {}
+                    pipe = r.pipeline(transaction=False)
+                    for key, ts in items:
+                        exchange, symbol = key
+                        bids, asks = orderbooks[key]
+                        dom_json, top = _dom_json(bids, asks, ts)
+                        pipe.set(REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol), dom_json)
+                        if top != last_top.get(key):
+                            new_top[key] = top
+                            slices_key = REDIS_KEY_ORDERBOOK_SLICES.format(exchange=exchange, symbol=symbol)
+                            pipe.rpush(slices_key, dom_json)
+                            pipe.ltrim(slices_key, -SLICES_MAXLEN, -1)
+                    await pipe.execute()
+                    # last_top — только после успешной записи, иначе срез не повторился бы
+                    last_top.update(new_top)
+            except Exception as e:
+                print(f"[hot] Publish error: {e}")
+                # Ключи не опубликованы: снова dirty на следующий тик (более свежий ts не затираем)
+                for key, ts in items:
+                    dirty.setdefault(key, ts)
+
+    publisher = asyncio.create_task(_publish_dirty())
 
     while True:
         try:
-            streams = [
-                [STREAM_ORDERBOOK_UPDATES, last_ids[STREAM_ORDERBOOK_UPDATES]],
-                [STREAM_TRADES, last_ids[STREAM_TRADES]],
-            ]
-            result = await r.xread(streams=dict(streams), count=100, block=5000)
+            result = await r.xread(streams=dict(last_ids), count=100, block=5000)
             if not result:
                 continue
 
+            # Записи пачки xread копятся и уходят одним pipeline: DOM — только последний по
+            # ключу, slices/trades — один RPUSH со всеми элементами и один LTRIM на ключ
+            dom_latest: dict[str, bytes] = {}
+            slice_items: dict[str, list] = defaultdict(list)
+            trade_items: dict[str, list] = defaultdict(list)
+
             for stream_name, messages in result:
                 for msg_id, fields in messages:
                     last_ids[stream_name] = msg_id
-                    payload_str = (fields or {}).get("payload")
+                    payload_str = (fields or {}).get(b"payload")
                     if not payload_str:
                         continue
                     try:
-                        payload = json.loads(payload_str)
-                    except json.JSONDecodeError:
+                        payload = orjson.loads(payload_str)
+                    except orjson.JSONDecodeError:
                         continue
 
-                    if stream_name == STREAM_ORDERBOOK_UPDATES:
+                    if stream_name == _ORDERBOOK_STREAM:
                         exchange = payload.get(EXCHANGE_FIELD, "")
                         symbol = payload.get(SYMBOL_FIELD, "")
                         key = (exchange, symbol)
                         if key not in orderbooks:
-                            orderbooks[key] = ({}, {})
+                            orderbooks[key] = _new_book()
                         bids, asks = orderbooks[key]
+                        ts = payload.get(TS_FIELD, 0)
                         if payload.get(TYPE_FIELD) == "snapshot":
+                            # Snapshot публикуется сразу: его состояние не схлопывается с delta
                             _apply_snapshot(bids, asks, payload)
+                            dirty.pop(key, None)
+                            dom_json, top = _dom_json(bids, asks, ts)
+                            dom_latest[REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)] = dom_json
+                            if top != last_top.get(key):
+                                last_top[key] = top
+                                slice_items[REDIS_KEY_ORDERBOOK_SLICES.format(exchange=exchange, symbol=symbol)].append(dom_json)
                         else:
                             _apply_delta(bids, asks, payload)
-                        ts = payload.get(TS_FIELD, 0)
-                        b_list, a_list = _to_lists(bids, asks)
-                        dom_key = REDIS_KEY_DOM.format(exchange=exchange, symbol=symbol)
-                        await r.set(dom_key, json.dumps({"ts": ts, "bids": b_list, "asks": a_list}))
-                        slices_key = REDIS_KEY_ORDERBOOK_SLICES.format(exchange=exchange, symbol=symbol)
-                        slice_item = json.dumps({"ts": ts, "bids": b_list, "asks": a_list})
-                        await r.rpush(slices_key, slice_item)
-                        await r.ltrim(slices_key, -SLICES_MAXLEN, -1)
-
-                    elif stream_name == STREAM_TRADES:
+                            dirty[key] = ts
+
+                    elif stream_name == _TRADES_STREAM:
                         exchange = payload.get(EXCHANGE_FIELD, "")
                         symbol = payload.get(SYMBOL_FIELD, "")
-                        trades_key = REDIS_KEY_TRADES.format(exchange=exchange, symbol=symbol)
-                        await r.rpush(trades_key, payload_str)
-                        await r.ltrim(trades_key, -TRADES_MAXLEN, -1)
+                        trade_items[REDIS_KEY_TRADES.format(exchange=exchange, symbol=symbol)].append(payload_str)
+
+            if dom_latest or slice_items or trade_items:
+                async with write_lock:
+                    pipe = r.pipeline(transaction=False)
+                    for dom_key, dom_json in dom_latest.items():
+                        pipe.set(dom_key, dom_json)
+                    for slices_key, items in slice_items.items():
+                        pipe.rpush(slices_key, *items)
+                        pipe.ltrim(slices_key, -SLICES_MAXLEN, -1)
+                    for trades_key, items in trade_items.items():
+                        pipe.rpush(trades_key, *items)
+                        pipe.ltrim(trades_key, -TRADES_MAXLEN, -1)
+                    await pipe.execute()
 
         except asyncio.CancelledError:
             break
@@ -122,6 +218,8 @@ async def run_hot_storage(redis_url: str):
             print(f"[hot] Error: {e}")
             await asyncio.sleep(1)
 
+    publisher.cancel()
+
 
 def main():
     parser = argparse.ArgumentParser()